@@ -0,0 +1,192 @@
+import json
+import os
+import queue
+import threading
+from bisect import bisect_right
+
+NS_PER_SECOND = 1_000_000_000
+
+_STOP = object()
+
+
+def rebase_event(action, anchor_ns):
+    # 把 perf_counter_ns 原始时间戳换算成相对视频开始的秒数, 返回新的 dict
+    action = dict(action)
+    for key in ("time", "start_time", "end_time"):
+        if key in action:
+            action[key] = (action[key] - anchor_ns) / NS_PER_SECOND
+    for key in ("start", "end"):
+        if key in action:
+            action[key] = rebase_event(action[key], anchor_ns)
+    return action
+
+
+class ActionLogWriter:
+    # Append-only JSON Lines log. Events are handed to a background thread and
+    # written in batches, so memory stays flat and a crash only loses the
+    # events of the current batch.
+    #
+    # Events carry raw perf_counter_ns timestamps and are rebased to seconds
+    # since the first video frame as they are serialized. Until set_anchor()
+    # is called the video start is unknown, so those events are held back.
+    def __init__(self, filename, anchor_ns, batch_size=1000, flush_interval=1.0):
+        self.filename = filename
+        self.anchor_ns = anchor_ns
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.count = 0
+        self.file = None
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def append(self, event):
+        self.queue.put(event)
+
+    def set_anchor(self, anchor_ns):
+        self.queue.put(("anchor", anchor_ns))
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def _control(self, message):
+        if message[0] == "anchor":
+            self.anchor_ns = message[1]
+
+    def _write(self, batch):
+        if self.file is None:
+            self.file = open(self.filename, "a", encoding="utf-8")
+        write_events(self.file, batch, self.anchor_ns)
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def _run(self):
+        pending = []
+        anchored = False
+        stopped = False
+        while not stopped:
+            batch = []
+            try:
+                event = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            while True:
+                if event is _STOP:
+                    stopped = True
+                    break
+                if isinstance(event, tuple):
+                    self._control(event)
+                    if event[0] == "anchor":
+                        batch.extend(pending)
+                        pending = []
+                        anchored = True
+                elif anchored:
+                    batch.append(event)
+                else:
+                    pending.append(event)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    event = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if stopped:
+                batch.extend(pending)
+            if batch:
+                self._write(batch)
+                self.count += len(batch)
+        self._close()
+
+
+class SegmentedLogWriter(ActionLogWriter):
+    # 分段录制时每个视频分段对应一个日志文件, 日志中的时间相对该分段的开始。
+    # 分段边界来自 ffmpeg 的 segment list (add_segment), 还没结束的分段按
+    # segment_time 预测边界 (录制时强制关键帧, 预测值就是实际边界)。
+    def __init__(self, filename_pattern, anchor_ns, segment_time, **kwargs):
+        self.filename_pattern = filename_pattern
+        self.segment_time = segment_time
+        self.segments = []  # 已结束分段的 (start, end), 单位秒
+        self.files = {}
+        super().__init__(filename_pattern % 0, anchor_ns, **kwargs)
+
+    def add_segment(self, start, end):
+        self.queue.put(("segment", start, end))
+
+    def _control(self, message):
+        super()._control(message)
+        if message[0] == "segment":
+            self.segments.append((message[1], message[2]))
+            # 之前的分段不会再有新事件, 关闭文件
+            for index in [i for i in self.files if i < len(self.segments)]:
+                self.files.pop(index).close()
+
+    def segment_of(self, t):
+        open_start = self.segments[-1][1] if self.segments else 0.0
+        if t >= open_start or not self.segments:
+            ahead = max(0, int((t - open_start) // self.segment_time))
+            return len(self.segments) + ahead, open_start + ahead * self.segment_time
+        index = max(0, bisect_right([s[0] for s in self.segments], t) - 1)
+        return index, self.segments[index][0]
+
+    def _write(self, batch):
+        groups = {}
+        for event in batch:
+            t = event["time" if "time" in event else "start_time"]
+            index, start = self.segment_of((t - self.anchor_ns) / NS_PER_SECOND)
+            groups.setdefault((index, start), []).append(event)
+        for (index, start), events in groups.items():
+            if index not in self.files:
+                self.files[index] = open(
+                    self.filename_pattern % index, "a", encoding="utf-8"
+                )
+            write_events(
+                self.files[index],
+                events,
+                self.anchor_ns + int(start * NS_PER_SECOND),
+            )
+
+    def _close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+def write_events(f, events, anchor_ns):
+    f.write(
+        "\n".join(
+            json.dumps(rebase_event(e, anchor_ns), ensure_ascii=False) for e in events
+        )
+        + "\n"
+    )
+    f.flush()
+
+
+def iter_log(filename):
+    if filename.endswith(".jsonl"):
+        with open(filename, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程崩溃时最后一行可能没有写完整
+                    break
+    else:
+        with open(filename, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+def load_log(filename):
+    return list(iter_log(filename))
+
+
+def is_log_file(filename):
+    # frames_*.json 是录制时保存的帧时间映射, 不是动作日志
+    if os.path.basename(filename).startswith("frames_"):
+        return False
+    return filename.endswith(".json") or filename.endswith(".jsonl")
@@ -0,0 +1,50 @@
+import argparse
+import tempfile
+import time
+from datetime import datetime
+import pyautogui
+from detect import Recorder
+
+
+# 缓存之前的 on_move: 每个事件都查询一次屏幕尺寸, 并做 datetime 时间差
+def legacy_on_move(recorder, x, y):
+    action_time = (datetime.now() - recorder.legacy_start_time).total_seconds()
+    width, height = pyautogui.size()
+    recorder.action_log.append(
+        {
+            "time": action_time,
+            "type": "mouse_move",
+            "position": {"x": x / width, "y": y / height},
+        }
+    )
+
+
+def bench(callback, n):
+    start = time.perf_counter()
+    for i in range(n):
+        callback(i % 1920, i % 1080)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main(n):
+    with tempfile.TemporaryDirectory() as folder:
+        recorder = Recorder(folder, 720)
+        recorder.legacy_start_time = datetime.now()
+        size_cost = bench(lambda x, y: pyautogui.size(), n)
+        recorder.action_log = []
+        legacy_cost = bench(lambda x, y: legacy_on_move(recorder, x, y), n)
+        recorder.action_log = []
+        cached_cost = bench(recorder.on_move, n)
+
+    print(f"events:              {n}")
+    print(f"pyautogui.size():    {size_cost:.2f} us/call")
+    print(f"on_move (per-event): {legacy_cost:.2f} us/event")
+    print(f"on_move (cached):    {cached_cost:.2f} us/event")
+    print(f"speedup:             {legacy_cost / cached_cost:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mouse callback cost benchmark")
+    parser.add_argument("-n", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.n)
@@ -0,0 +1,504 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import cv2
+import numpy as np
+from find import (
+    CROSSOVER_FILE,
+    CursorTracker,
+    FFTMatcher,
+    LogGuide,
+    calculate_overlap,
+    load_templates,
+    match_exhaustive,
+    match_mouse,
+    save_crossover,
+)
+
+THRESHOLD_MIN = 0.68
+THRESHOLD_MAX = 0.75
+OVERLAP_THRESHOLD = 0.6
+SEARCH_WINDOW_SIZE = 200
+FLICK_SPEED = 80  # 甩动时的最大速度, 像素/帧
+FLICK_FRAMES = 8
+DISTRACTOR_COPIES = 3
+
+
+def synthetic_background(width, height, rng, distractors=()):
+    # 模拟桌面: 浅色底, 若干窗口和几行文字; distractors 中的每个模板
+    # (比如 cursors/negative 里的) 贴在 DISTRACTOR_COPIES 个随机位置
+    frame = np.full((height, width, 3), 235, np.uint8)
+    for _ in range(12):
+        x, y = rng.integers(0, width - 100), rng.integers(0, height - 80)
+        w, h = rng.integers(100, 500), rng.integers(80, 300)
+        color = tuple(int(c) for c in rng.integers(120, 255, 3))
+        cv2.rectangle(frame, (int(x), int(y)), (int(x + w), int(y + h)), color, -1)
+        for row in range(int(y) + 20, int(y + h), 18):
+            cv2.putText(
+                frame,
+                "lorem ipsum dolor sit amet",
+                (int(x) + 6, row),
+                cv2.FONT_HERSHEY_PLAIN,
+                1,
+                (30, 30, 30),
+                1,
+            )
+    for template in distractors:
+        th, tw = template.shape[:2]
+        for _ in range(DISTRACTOR_COPIES):
+            x, y = int(rng.integers(0, width - tw)), int(rng.integers(0, height - th))
+            frame[y : y + th, x : x + tw] = cv2.cvtColor(template, cv2.COLOR_GRAY2BGR)
+    return frame
+
+
+def synthetic_frames(
+    templates,
+    count,
+    width,
+    height,
+    seed,
+    distractors=(),
+    flick_speed=FLICK_SPEED,
+):
+    # 在背景上贴一个光标模板。光标大多数时候慢速移动, 偶尔快速甩动几帧,
+    # 偶尔直接跳到别处
+    rng = np.random.default_rng(seed)
+    background = synthetic_background(width, height, rng, distractors)
+    template, name = templates[int(rng.integers(len(templates)))]
+    th, tw = template.shape[:2]
+    x, y = width // 2, height // 2
+    vx, vy = rng.normal(0, 4, 2)
+    flick = None
+    for _ in range(count):
+        if rng.random() < 0.02:
+            x, y = rng.integers(0, width - tw), rng.integers(0, height - th)
+        if flick is None and rng.random() < 0.05:
+            # 速度在 FLICK_FRAMES 帧内按正弦曲线升到 flick_speed 再降下来
+            angle = rng.uniform(0, 2 * np.pi)
+            flick = (np.cos(angle), np.sin(angle), 0)
+        if flick is not None:
+            dx, dy, step = flick
+            speed = flick_speed * np.sin(np.pi * (step + 1) / (FLICK_FRAMES + 1))
+            vx, vy = speed * dx, speed * dy
+            flick = (dx, dy, step + 1) if step + 1 < FLICK_FRAMES else None
+            if flick is None:
+                vx, vy = rng.normal(0, 4, 2)
+        if not 0 <= x + vx <= width - tw:
+            vx = -vx
+        if not 0 <= y + vy <= height - th:
+            vy = -vy
+        x = int(np.clip(x + vx, 0, width - tw))
+        y = int(np.clip(y + vy, 0, height - th))
+        frame = background.copy()
+        frame[y : y + th, x : x + tw] = cv2.cvtColor(template, cv2.COLOR_GRAY2BGR)
+        yield frame, (x, y, tw, th)
+
+
+def video_frames(video_path, count):
+    cap = cv2.VideoCapture(video_path)
+    for _ in range(count):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame, None
+    cap.release()
+
+
+def synthetic_log(
+    templates, count, width, height, seed, fps=30, flick_speed=FLICK_SPEED
+):
+    # 与 synthetic_frames 同一条轨迹的 mouse_move 日志, 热点在模板左上角
+    # 往里 2 像素, 记录时间有几毫秒的抖动
+    rng = np.random.default_rng(seed + 1)
+    events = []
+    for frame_index, (_, (x, y, _, _)) in enumerate(
+        synthetic_frames(templates, count, width, height, seed, flick_speed=flick_speed)
+    ):
+        events.append(
+            {
+                "time": frame_index / fps + rng.normal(0, 0.003),
+                "type": "mouse_move",
+                "position": {"x": (x + 2) / width, "y": (y + 2) / height},
+            }
+        )
+    return LogGuide(events, fps)
+
+
+def run(
+    frames,
+    templates,
+    negative_templates,
+    matcher,
+    mode,
+    nms_threshold,
+    guide=None,
+    window_size=SEARCH_WINDOW_SIZE,
+    thresholds=(THRESHOLD_MIN, THRESHOLD_MAX),
+):
+    # mode: predict 预测位置和自适应窗口, fixed 以上一次位置为中心的固定窗口,
+    # full 每帧都搜全图, log 在日志给出的位置附近搜索
+    tracker = CursorTracker(window_size, adaptive=mode != "fixed")
+    stats = {}
+    hits = 0
+    false_matches = 0
+    latencies = []
+    errors = []  # 找到时匹配框中心与真实中心的距离, 像素
+    for frame_index, (frame, truth) in enumerate(frames):
+        start = time.perf_counter()
+        center, window_size = tracker.predict(frame_index)
+        expected = None
+        if mode == "log":
+            expected = guide.expected(frame_index, frame.shape[1], frame.shape[0])
+            if expected is not None:
+                center, window_size = expected, guide.window_size
+        match = match_mouse(
+            frame,
+            templates,
+            negative_templates,
+            None if mode == "full" else center,
+            window_size,
+            thresholds[0],
+            thresholds[1],
+            OVERLAP_THRESHOLD,
+            matcher=matcher,
+            nms_threshold=nms_threshold,
+            stats=stats,
+        )
+        if match:
+            (x, y), (h, w) = match[0], match[1]
+            tracker.update(frame_index, (x + w // 2, y + h // 2))
+            if expected is not None:
+                guide.observe(expected, (x + w // 2, y + h // 2))
+        latencies.append(time.perf_counter() - start)
+        # 模板之间有重叠部分, 匹配框和真实位置重叠过半就算找到
+        if match and truth is not None:
+            if calculate_overlap((x, y, w, h), truth) >= 0.5:
+                hits += 1
+                tx, ty, tw, th = truth
+                errors.append(
+                    float(np.hypot(x + w / 2 - tx - tw / 2, y + h / 2 - ty - th / 2))
+                )
+            else:
+                false_matches += 1
+    return {
+        "fps": len(latencies) / sum(latencies),
+        "frames": len(latencies),
+        "hits": hits,
+        "false_matches": false_matches,
+        "latencies": latencies,
+        "errors": errors,
+        "stats": stats,
+    }
+
+
+def summarize(result, synthetic=True):
+    # run() 的结果中可以写进 JSON 的部分, 时间单位毫秒
+    latencies = np.array(result["latencies"]) * 1000
+    summary = {
+        "fps": result["fps"],
+        "frames": result["frames"],
+        "latency_ms": {
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p99": float(np.percentile(latencies, 99)),
+            "max": float(latencies.max()),
+        },
+        "stats": result["stats"],
+    }
+    if synthetic:
+        errors = np.array(result["errors"])
+        summary.update(
+            {
+                "located": result["hits"] / result["frames"],
+                "false_matches": result["false_matches"] / result["frames"],
+                # 一次都没找到时为 None
+                "error_px": (
+                    {
+                        "mean": float(errors.mean()),
+                        "p50": float(np.percentile(errors, 50)),
+                        "p99": float(np.percentile(errors, 99)),
+                    }
+                    if len(errors)
+                    else None
+                ),
+            }
+        )
+    return summary
+
+
+def report(label, summary):
+    roi = summary["stats"].get("roi", 0)
+    fallback = summary["stats"].get("fallback", 0) / roi if roi else None
+    line = (
+        f"{label}: {summary['fps']:8.1f} fps "
+        f"p50 {summary['latency_ms']['p50']:7.2f} ms "
+        f"p99 {summary['latency_ms']['p99']:7.2f} ms  fallback "
+        + ("     -" if fallback is None else f"{fallback:6.1%}")
+    )
+    if "located" in summary:
+        line += (
+            f"  located {summary['located']:6.1%}"
+            f"  false {summary['false_matches']:6.1%}"
+        )
+        if summary["error_px"] is not None:
+            line += f"  error {summary['error_px']['p50']:5.2f} px"
+
+    print(line)
+
+
+def crossover(templates, width, height, seed, repeat=7):
+    # 不同大小的搜索区域上逐个模板匹配与 FFT 匹配的耗时 (中位数)
+    gray = cv2.cvtColor(
+        synthetic_background(width, height, np.random.default_rng(seed)),
+        cv2.COLOR_BGR2GRAY,
+    )
+    fft = FFTMatcher(crossover=0)
+    faster = []
+    for size in (64, 96, 128, 160, 200, 256, 320, 400, 512, min(width, height)):
+        area = gray[:size, :size]
+        timings = {"spatial": [], "fft": []}
+        for _ in range(repeat):
+            for name, matcher in (("spatial", match_exhaustive), ("fft", fft)):
+                start = time.perf_counter()
+                list(matcher(area, templates))
+                timings[name].append(time.perf_counter() - start)
+        spatial = statistics.median(timings["spatial"]) * 1000
+        fft_ms = statistics.median(timings["fft"]) * 1000
+        # 差距在测量噪声以内时不算 FFT 更快
+        faster.append((size, fft_ms < 0.9 * spatial))
+        print(f"{size:>5} px: spatial {spatial:8.2f} ms  fft {fft_ms:8.2f} ms")
+    # 交叉点取 FFT 在该大小及以上都更快的最小尺寸
+    crossover_size = None
+    for size, fft_faster in reversed(faster):
+        if not fft_faster:
+            break
+        crossover_size = size
+    # 保存后 find.py 的 "auto" 按测得的交叉点选择, 都是逐像素更快时存 None
+    if crossover_size is None:
+        print("spatial matching is faster at every size tested")
+        save_crossover(None)
+    else:
+        print(f"FFT is faster from {crossover_size}x{crossover_size}")
+        save_crossover(crossover_size * crossover_size)
+    print(f"saved to {CROSSOVER_FILE}")
+
+
+def parse_size(size):
+    width, height = (int(v) for v in size.split("x"))
+    return width, height
+
+
+def suite(templates, negative_templates, args):
+    # 以 --size、SEARCH_WINDOW_SIZE、全部模板和默认阈值为基准, 每次只改变
+    # 一个参数 (分辨率、固定窗口大小、模板数、阈值), 每个配置都在同一组
+    # 合成帧上比较各个匹配方式。负模板作为干扰物贴在背景上。
+    templates = sorted(templates, key=lambda t: t[1])
+    base = {
+        "size": args.size,
+        "roi": SEARCH_WINDOW_SIZE,
+        "templates": len(templates),
+        "thresholds": (THRESHOLD_MIN, THRESHOLD_MAX),
+    }
+    axes = {
+        "size": args.sizes,
+        "roi": args.roi_sizes,
+        "templates": [min(n, len(templates)) for n in args.template_counts],
+        "thresholds": [tuple(float(v) for v in t.split(":")) for t in args.thresholds],
+    }
+    configs = [base]
+    for axis, values in axes.items():
+        for value in values:
+            config = dict(base, **{axis: value})
+            if config not in configs:
+                configs.append(config)
+
+    results = []
+    for config in configs:
+        width, height = parse_size(config["size"])
+        subset = templates[: config["templates"]]
+        print(
+            f"{config['size']} roi={config['roi']} templates={config['templates']} "
+            f"thresholds={config['thresholds'][0]}/{config['thresholds'][1]}"
+        )
+        for matcher in args.matchers:
+            for mode in args.modes:
+                frames = synthetic_frames(
+                    subset,
+                    args.frames,
+                    width,
+                    height,
+                    args.seed,
+                    distractors=negative_templates,
+                )
+                summary = summarize(
+                    run(
+                        frames,
+                        subset,
+                        negative_templates,
+                        matcher,
+                        mode,
+                        args.nms,
+                        window_size=config["roi"],
+                        thresholds=config["thresholds"],
+                    )
+                )
+                report(f"{matcher:>10} {mode:>8}", summary)
+                results.append(
+                    {
+                        **config,
+                        "thresholds": list(config["thresholds"]),
+                        "matcher": matcher,
+                        "mode": mode,
+                        **summary,
+                    }
+                )
+    return results
+
+
+def environment():
+    # 比较不同提交的结果时需要知道是在什么环境下测的
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main(args):
+    templates, negative_templates = load_templates(
+        args.template_dir, args.negative_template_dir
+    )
+    width, height = parse_size(args.size)
+    if args.crossover:
+        crossover(templates, width, height, args.seed)
+        return None
+    if args.suite:
+        return suite(templates, negative_templates, args)
+    results = []
+    for matcher in args.matchers:
+        for mode in args.modes:
+            guide = None
+            if mode == "log":
+                if args.log:
+                    fps = cv2.VideoCapture(args.video).get(cv2.CAP_PROP_FPS)
+                    guide = LogGuide.from_files(args.log, fps)
+                elif args.video:
+                    continue
+                else:
+                    guide = synthetic_log(
+                        templates,
+                        args.frames,
+                        width,
+                        height,
+                        args.seed,
+                        flick_speed=args.flick_speed,
+                    )
+            if args.video:
+                frames = video_frames(args.video, args.frames)
+            else:
+                frames = synthetic_frames(
+                    templates,
+                    args.frames,
+                    width,
+                    height,
+                    args.seed,
+                    flick_speed=args.flick_speed,
+                )
+            summary = summarize(
+                run(
+                    frames,
+                    templates,
+                    negative_templates,
+                    matcher,
+                    mode,
+                    args.nms,
+                    guide,
+                ),
+                synthetic=not args.video,
+            )
+            report(f"{matcher:>10} {mode:>8}", summary)
+            results.append({"matcher": matcher, "mode": mode, **summary})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cursor matcher benchmark")
+    parser.add_argument("--template-dir", default="cursors/positive")
+    parser.add_argument("--negative-template-dir", default="cursors/negative")
+    parser.add_argument("--video", help="use a real capture instead of synthetic")
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--flick-speed",
+        type=float,
+        default=FLICK_SPEED,
+        help="peak speed of synthetic flicks, pixels per frame",
+    )
+    parser.add_argument(
+        "--matchers",
+        nargs="+",
+        default=["exhaustive", "pyramid", "fft", "auto", "gradient"],
+    )
+    parser.add_argument(
+        "--crossover",
+        action="store_true",
+        help="time spatial vs FFT matching over ROI sizes",
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        help="default: log predict fixed full (fixed full with --suite)",
+    )
+    parser.add_argument("--log", help="action log recorded with --video")
+    parser.add_argument("--nms", type=float, help="NMS overlap threshold")
+    parser.add_argument(
+        "--suite",
+        action="store_true",
+        help="sweep resolution, ROI size, template count and thresholds",
+    )
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1920x1080"])
+    parser.add_argument("--roi-sizes", nargs="+", type=int, default=[128, 320])
+    parser.add_argument("--template-counts", nargs="+", type=int, default=[1, 4])
+    parser.add_argument(
+        "--thresholds",
+        nargs="+",
+        default=["0.6:0.7", "0.8:0.9"],
+        help="threshold_min:threshold_max pairs",
+    )
+    parser.add_argument(
+        "--json", help="write results as JSON to this file (- for stdout)"
+    )
+    args = parser.parse_args()
+    if args.modes is None:
+        # suite 里的 full 每帧都搜全图, 给出有干扰物时全图搜索的准确率
+        args.modes = (
+            ["fixed", "full"] if args.suite else ["log", "predict", "fixed", "full"]
+        )
+    results = main(args)
+    if args.json and results is not None:
+        output = json.dumps(
+            {"environment": environment(), "args": vars(args), "results": results},
+            indent=2,
+        )
+        if args.json == "-":
+            print(output)
+        else:
+            with open(args.json, "w") as f:
+                f.write(output + "\n")
@@ -0,0 +1,47 @@
+import argparse
+import tempfile
+import threading
+import time
+from detect import Recorder, SCROLL_TIMEOUT
+
+
+# 合成滚动风暴: 每一轮以 rate Hz 连续滚动 duration 秒, 然后停顿等待超时落盘。
+# 期望每一轮正好得到一条 scroll 事件, 且线程数不随滚动次数增长。
+def main(bursts, rate, duration):
+    with tempfile.TemporaryDirectory() as folder:
+        recorder = Recorder(folder, 720)
+        recorder.scheduler.start()
+        baseline_threads = threading.active_count()
+        peak_threads = baseline_threads
+        peak_heap = 0
+        ticks = 0
+        interval = 1.0 / rate
+
+        for burst in range(bursts):
+            end = time.perf_counter() + duration
+            while time.perf_counter() < end:
+                recorder.on_scroll(500, 500, 0, 1)
+                ticks += 1
+                peak_threads = max(peak_threads, threading.active_count())
+                peak_heap = max(peak_heap, len(recorder.scheduler.heap))
+                time.sleep(interval)
+            time.sleep(SCROLL_TIMEOUT * 2)
+
+        recorder.scheduler.stop(run_pending=True)
+        scrolls = [a for a in recorder.action_log if a["type"] == "scroll"]
+        amount = sum(a["amount"] for a in scrolls)
+
+    print(f"wheel ticks:      {ticks}")
+    print(f"threads:          {baseline_threads} baseline, {peak_threads} peak")
+    print(f"peak heap size:   {peak_heap}")
+    print(f"scroll events:    {len(scrolls)} (expected {bursts})")
+    print(f"ticks accounted:  {amount} of {ticks}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scroll storm benchmark")
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--rate", type=float, default=1000)
+    parser.add_argument("--duration", type=float, default=1.0)
+    args = parser.parse_args()
+    main(args.bursts, args.rate, args.duration)
@@ -0,0 +1,266 @@
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import threading
+import time
+from actionlog import NS_PER_SECOND
+from encoder import CONFIG_FOLDER, encoder_args
+from framemap import FrameMap, read_progress
+
+DEVICE_CACHE_FILE = os.path.join(CONFIG_FOLDER, "devices.json")
+# 设备列表缓存的有效期, 过期或 ffmpeg 更新后重新探测
+DEVICE_CACHE_TTL = 7 * 24 * 3600
+
+
+def ffmpeg_signature():
+    path = shutil.which("ffmpeg") or "ffmpeg"
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    return {"ffmpeg": path, "ffmpeg_mtime": mtime}
+
+
+class DeviceCache:
+    # 把设备探测结果缓存在磁盘上, 避免每次开始录制都多跑一个 ffmpeg 子进程
+    def __init__(self, filename=DEVICE_CACHE_FILE, ttl=DEVICE_CACHE_TTL):
+        self.filename = filename
+        self.ttl = ttl
+
+    def _read(self):
+        if not os.path.exists(self.filename):
+            return {}
+        try:
+            with open(self.filename, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        entry = self._read().get(key)
+        if entry is None:
+            return None
+        signature = ffmpeg_signature()
+        if (
+            entry.get("ffmpeg") != signature["ffmpeg"]
+            or entry.get("ffmpeg_mtime") != signature["ffmpeg_mtime"]
+            or time.time() - entry.get("time", 0) > self.ttl
+        ):
+            return None
+        return entry["value"]
+
+    def set(self, key, value):
+        data = self._read()
+        data[key] = {"value": value, "time": time.time(), **ffmpeg_signature()}
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        with open(self.filename, "w") as f:
+            json.dump(data, f, indent=4)
+
+    def invalidate(self, key):
+        data = self._read()
+        if data.pop(key, None) is not None:
+            with open(self.filename, "w") as f:
+                json.dump(data, f, indent=4)
+
+
+class CaptureBackend:
+    name = None
+
+    def __init__(self, thread_queue_size=None, device_cache=None):
+        self.thread_queue_size = thread_queue_size
+        self.device_cache = device_cache or DeviceCache()
+
+    def input_args(self, fps):
+        raise NotImplementedError
+
+    def invalidate(self):
+        # 采集启动失败时调用, 下次重新探测设备
+        pass
+
+
+class X11GrabBackend(CaptureBackend):
+    name = "x11grab"
+
+    def input_args(self, fps):
+        return [
+            "-f",
+            "x11grab",
+            "-framerate",
+            str(fps),
+            "-capture_cursor",
+            "1",
+            "-i",
+            os.environ.get("DISPLAY", ":0.0"),
+        ]
+
+
+class GDIGrabBackend(CaptureBackend):
+    name = "gdigrab"
+
+    def input_args(self, fps):
+        args = ["-f", "gdigrab", "-framerate", str(fps)]
+        if self.thread_queue_size:
+            args += ["-thread_queue_size", str(self.thread_queue_size)]
+        return args + ["-i", "desktop"]
+
+
+class AVFoundationBackend(CaptureBackend):
+    name = "avfoundation"
+
+    def screen_device(self):
+        device = self.device_cache.get(self.name)
+        if device is not None:
+            return device
+
+        # 在 macOS 上自动选择屏幕捕捉设备
+        process = subprocess.Popen(
+            ["ffmpeg", "-f", "avfoundation", "-list_devices", "true", "-i", '""'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        devices_output, _ = process.communicate()
+        for line in devices_output.decode("utf-8").split("\n"):
+            if "Capture screen" in line:
+                device = re.findall(r"\[(.*?)\]", line)[1]
+                print(f"Screen capture device found: {device}")
+                break
+
+        if device is None:
+            raise RuntimeError("No screen capture device found.")
+        self.device_cache.set(self.name, device)
+        return device
+
+    def input_args(self, fps):
+        return [
+            "-f",
+            "avfoundation",
+            "-framerate",
+            str(fps),
+            "-capture_cursor",
+            "1",
+            "-i",
+            self.screen_device(),
+        ]
+
+    def invalidate(self):
+        self.device_cache.invalidate(self.name)
+
+
+class LavfiBackend(CaptureBackend):
+    # 测试用的合成画面, 不需要显示器, 以实时速率输出
+    name = "lavfi"
+
+    def __init__(self, size="1920x1080", **kwargs):
+        super().__init__(**kwargs)
+        self.size = size
+
+    def input_args(self, fps):
+        return ["-re", "-f", "lavfi", "-i", f"testsrc2=size={self.size}:rate={fps}"]
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (X11GrabBackend, GDIGrabBackend, AVFoundationBackend, LavfiBackend)
+}
+
+
+def get_backend(name=None, **kwargs):
+    # 可以用环境变量 SCREEN_CAPTURE_BACKEND 指定, 比如在 CI 上用 lavfi
+    name = name or os.environ.get("SCREEN_CAPTURE_BACKEND")
+    if name is None:
+        system = platform.system()
+        if system == "Windows":
+            name = "gdigrab"
+        elif system == "Darwin":
+            name = "avfoundation"
+        else:  # 假定为 Linux
+            name = "x11grab"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown capture backend: {name}")
+    return BACKENDS[name](**kwargs)
+
+
+class Capture:
+    # 一个 ffmpeg 采集进程。进度以 key=value 形式持续输出到 stderr, 用来建立
+    # 帧序号到时间的映射, 并测量从启动到第一帧的延迟。
+    def __init__(
+        self,
+        backend,
+        profile,
+        resolution_string,
+        output_args,
+        frame_map=None,
+        on_first_frame=None,
+    ):
+        self.backend = backend
+        self.profile = profile
+        self.resolution_string = resolution_string
+        self.output_args = output_args
+        self.frame_map = frame_map if frame_map is not None else FrameMap()
+        self.on_first_frame = on_first_frame
+        self.process = None
+        self.progress_thread = None
+        self.launch_ns = None
+        self.first_frame_ns = None
+        self.start_latency = None
+
+    def command(self):
+        return [
+            "ffmpeg",
+            "-progress",
+            "pipe:2",
+            "-nostats",
+            "-loglevel",
+            "error",
+            *self.backend.input_args(self.profile["fps"]),
+            "-vf",
+            self.resolution_string,
+            *encoder_args(self.profile),
+            *self.output_args,
+        ]
+
+    def start(self):
+        self.launch_ns = time.perf_counter_ns()
+        command = self.command()
+        kwargs = {}
+        # 在 Windows 上隐藏 ffmpeg 的控制台窗口
+        if platform.system() == "Windows":
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            kwargs["startupinfo"] = startupinfo
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs
+        )
+        self.progress_thread = threading.Thread(
+            target=read_progress,
+            args=(self.process.stderr, self.frame_map, self._first_frame),
+            daemon=True,
+        )
+        self.progress_thread.start()
+
+    def _first_frame(self, video_start_ns):
+        # video_start_ns 已经扣除了进度输出的间隔, 是第一帧的实际时间
+        self.first_frame_ns = video_start_ns
+        self.start_latency = (video_start_ns - self.launch_ns) / NS_PER_SECOND
+        print(f"Recording started ({self.start_latency * 1000:.0f} ms to first frame).")
+        if self.on_first_frame is not None:
+            self.on_first_frame(video_start_ns)
+
+    def stop(self):
+        # 发送 'q' 信号给 ffmpeg 进程,正常结束录制
+        try:
+            self.process.stdin.write("q".encode())
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+        # 等待 ffmpeg 进程完成
+        self.process.wait()
+        self.progress_thread.join()
+        if self.first_frame_ns is None:
+            # 一帧都没有录到, 可能是缓存的设备已经失效
+            self.backend.invalidate()
+        return self.process.returncode
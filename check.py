@@ -1,6 +1,7 @@
-import json
 import os
 import cv2
+from actionlog import is_log_file, load_log
+from framemap import FrameMap
 
 
 def draw_marker(frame, action, width, height):
@@ -52,9 +53,12 @@ def draw_marker(frame, action, width, height):
     return frame
 
 
-def mark_video(log_file, video_file, output_file, time_offset):
-    with open(log_file, "r") as f:
-        actions = json.load(f)
+def action_time(action):
+    return action["time" if "time" in action else "start_time"]
+
+
+def mark_video(log_file, video_file, output_file, time_offset, frame_map=None):
+    actions = load_log(log_file)
 
     cap = cv2.VideoCapture(video_file)
     fps = cap.get(cv2.CAP_PROP_FPS)
@@ -71,13 +75,11 @@ def mark_video(log_file, video_file, output_file, time_offset):
         if not ret:
             break
 
-        while (
-            action_index < len(actions)
-            and actions[action_index][
-                "time" if "time" in actions[action_index] else "start_time"
-            ]
-            + time_offset
-            <= current_frame / fps
+        # 有帧时间映射时直接查出动作对应的帧, 不再需要手动的 time_offset
+        while action_index < len(actions) and (
+            frame_map.index_at(action_time(actions[action_index])) <= current_frame
+            if frame_map is not None
+            else action_time(actions[action_index]) + time_offset <= current_frame / fps
         ):
             frame = draw_marker(frame, actions[action_index], width, height)
             action_index += 1
@@ -96,10 +98,10 @@ def main(selected_folder, time_offset=0):
     os.makedirs(output_folder, exist_ok=True)
 
     for log_filename in os.listdir(log_folder):
-        if log_filename.endswith(".json"):
+        if is_log_file(log_filename):
             log_file = os.path.join(log_folder, log_filename)
-            video_filename = log_filename.replace("log_", "screen_").replace(
-                ".json", ".mp4"
+            video_filename = (
+                log_filename.replace("log_", "screen_").rsplit(".", 1)[0] + ".mp4"
             )
             video_file = os.path.join(video_folder, video_filename)
             output_file = os.path.join(
@@ -110,8 +112,16 @@ def main(selected_folder, time_offset=0):
                 print(f"Skipping already processed file: {output_file}")
                 continue  # Skip this file as it has already been processed
 
+            frame_map_file = os.path.join(
+                log_folder,
+                log_filename.replace("log_", "frames_").rsplit(".", 1)[0] + ".json",
+            )
+            frame_map = None
+            if os.path.exists(frame_map_file):
+                frame_map = FrameMap.load(frame_map_file)
+
             if os.path.exists(video_file):
-                mark_video(log_file, video_file, output_file, time_offset)
+                mark_video(log_file, video_file, output_file, time_offset, frame_map)
                 print(f"Marked video saved to {output_file}")
             else:
                 print(f"Video file {video_file} does not exist.")
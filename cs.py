@@ -1,13 +1,12 @@
 import json
 import threading
 from pynput import mouse
-from datetime import datetime
-import subprocess
+from datetime import datetime, timedelta
 import os
-import pyautogui
 import time
-import platform
-import re
+from display import DisplayGeometry
+from encoder import load_profile
+from capture import Capture, get_backend
 
 
 class Recorder:
@@ -15,6 +14,8 @@ class Recorder:
         self.init(selected_folder, resolution)
 
     def init(self, selected_folder, resolution):
+        self.encoder = load_profile()
+        resolution = resolution or self.encoder["height"] or 720
         self.resolution_string = f"scale=-1:{resolution}"
         self.video_folder = os.path.join(selected_folder, "videos")
         self.log_folder = os.path.join(selected_folder, "logs")
@@ -24,150 +25,47 @@ class Recorder:
         self.record_thread = None
         self.stop_event = threading.Event()
         self.mouse_listener = None
-        self.screen_device = None
+        self.geometry = DisplayGeometry()
 
         # Initialize record folders
         os.makedirs(self.video_folder, exist_ok=True)
         os.makedirs(self.log_folder, exist_ok=True)
 
+    def on_video_start(self, video_start_ns):
+        elapsed = (time.perf_counter_ns() - video_start_ns) / 1e9
+        self.video_start_time = datetime.now() - timedelta(seconds=elapsed)
+
     def relative_time(self):
         return (datetime.now() - self.video_start_time).total_seconds()
 
     def record_screen(self):
         filename = os.path.join(self.video_folder, f"screen_{self.current_time}.mp4")
 
-        # 根据操作系统确定屏幕捕捉方法和命令行参数
-        if platform.system() == "Windows":
-            command = [
-                "ffmpeg",
-                "-f",
-                "gdigrab",
-                "-framerate",
-                "30",
-                "-i",
-                "desktop",
-                "-vf",
-                self.resolution_string,
-                "-vcodec",
-                "libx264",
-                "-r",
-                "30",
-                "-crf",
-                "30",
-                "-preset",
-                "ultrafast",
-                "-y",
-                filename,
-            ]
-        elif platform.system() == "Darwin":
-            # 在 macOS 上自动选择屏幕捕捉设备
-            if not self.screen_device:
-                process = subprocess.Popen(
-                    [
-                        "ffmpeg",
-                        "-f",
-                        "avfoundation",
-                        "-list_devices",
-                        "true",
-                        "-i",
-                        '""',
-                    ],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                )
-                devices_output, _ = process.communicate()
-                devices_output = devices_output.decode("utf-8")
-                lines = devices_output.split("\n")
-                for line in lines:
-                    if "Capture screen" in line:
-                        self.screen_device = re.findall(r"\[(.*?)\]", line)[1]
-                        print(f"Screen capture device found: {self.screen_device}")
-                        break
-
-                if self.screen_device is None:
-                    raise RuntimeError("No screen capture device found.")
-
-            command = [
-                "ffmpeg",
-                "-f",
-                "avfoundation",
-                "-framerate",
-                "30",
-                "-capture_cursor",
-                "1",
-                "-i",
-                self.screen_device,
-                "-vf",
-                self.resolution_string,
-                "-vcodec",
-                "h264_videotoolbox",
-                "-r",
-                "30",
-                "-crf",
-                "30",
-                "-preset",
-                "ultrafast",
-                "-y",
-                filename,
-            ]
-        else:  # 假定为 Linux
-            command = [
-                "ffmpeg",
-                "-f",
-                "x11grab",
-                "-framerate",
-                "30",
-                "-capture_cursor",
-                "1",
-                "-i",
-                ":0.0",
-                "-vf",
-                self.resolution_string,
-                "-vcodec",
-                "libx264",
-                "-r",
-                "30",
-                "-crf",
-                "30",
-                "-preset",
-                "ultrafast",
-                "-y",
-                filename,
-            ]
-
-        process = subprocess.Popen(
-            command, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        capture = Capture(
+            get_backend(),
+            self.encoder,
+            self.resolution_string,
+            ["-y", filename],
+            on_first_frame=self.on_video_start,
         )
-
-        # 等待录制开始
-        while True:
-            line = process.stderr.readline().decode("utf-8")
-            if "frame" in line:
-                print("Recording started.")
-                video_start_time = datetime.now()
-                self.video_start_time = video_start_time
-                break
+        capture.start()
 
         # 等待录制停止的信号
         while not self.stop_event.is_set():
             time.sleep(1)
 
-        # 发送 'q' 信号给 ffmpeg 进程,正常结束录制
-        process.communicate(input="q".encode())
-
-        # 等待 ffmpeg 进程完成
-        process.wait()
+        capture.stop()
 
         print("Recording stopped.")
 
     def on_move(self, x, y):
         action_time = self.relative_time()
-        width, height = pyautogui.size()
+        sx, sy = self.geometry.scale
         self.action_log.append(
             {
                 "time": action_time,
                 "type": "mouse_move",
-                "position": {"x": x / width, "y": y / height},
+                "position": {"x": x * sx, "y": y * sy},
             }
         )
 
@@ -179,6 +77,7 @@ class Recorder:
     def start_recording(self):
         self.mouse_listener = mouse.Listener(on_move=self.on_move)
         self.mouse_listener.start()
+        self.geometry.start()
 
         self.record_thread = threading.Thread(target=self.record_screen)
         self.record_thread.start()
@@ -193,6 +92,7 @@ class Recorder:
     def stop_recording(self):
         self.stop_event.set()  # Set stop event
         self.stop_listener()  # Stop mouse listener
+        self.geometry.stop()
         if self.record_thread is not None:
             self.record_thread.join()  # Ensure the recording thread has finished
         self.save_log()  # Save log file
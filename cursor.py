@@ -1,187 +1,185 @@
 import time
 import threading
+import queue
 import pyautogui
+from array import array
+from bisect import bisect_right
 from datetime import datetime
 import os
-import platform
-import subprocess
-import re
 import keyboard
+from encoder import load_profile
+from capture import Capture, get_backend
+
+# 采样延迟直方图的分桶上界, 单位微秒
+JITTER_BINS_US = [10, 50, 100, 250, 500, 1000, 5000]
+
+
+class MouseSampler:
+    # 按绝对截止时间 (start + k * period) 采样鼠标位置, 不会因为每次 sleep 的
+    # 误差累积而漂移: 先 sleep 到截止时间前 spin 秒, 再忙等到截止时间。
+    # 样本 (perf_counter_ns, x, y) 写入预先分配的 array('d') 环形缓冲区,
+    # 缓冲区按 chunk 划分, 写满的 chunk 由单独的线程以二进制追加到文件,
+    # 所以内存占用是固定的。
+    def __init__(
+        self,
+        filename,
+        rate=1000,
+        chunk_size=1024,
+        chunks=16,
+        spin=0.0002,
+        position=pyautogui.position,
+    ):
+        self.filename = filename
+        self.period_ns = int(1e9 / rate)
+        self.chunk_size = chunk_size
+        self.spin_ns = int(spin * 1e9)
+        self.position = position
+        self.buffer = array("d", bytes(8 * 3 * chunk_size * chunks))
+        self.free = queue.SimpleQueue()
+        for chunk in range(chunks):
+            self.free.put(chunk)
+        self.full = queue.SimpleQueue()
+        self.samples = 0
+        self.missed = 0
+        self.histogram = [0] * (len(JITTER_BINS_US) + 1)
+        self.elapsed_ns = 0
+
+    def run(self, stop_event):
+        writer = threading.Thread(target=self._write, daemon=True)
+        writer.start()
+
+        buffer = self.buffer
+        histogram = self.histogram
+        period_ns = self.period_ns
+        chunk = self.free.get()
+        pos = chunk * self.chunk_size * 3
+        end = pos + self.chunk_size * 3
+        start_ns = next_ns = time.perf_counter_ns()
+
+        while not stop_event.is_set():
+            remaining = next_ns - time.perf_counter_ns()
+            if remaining > self.spin_ns:
+                time.sleep((remaining - self.spin_ns) / 1e9)
+                continue
+            while time.perf_counter_ns() < next_ns:
+                pass
+
+            x, y = self.position()
+            now = time.perf_counter_ns()
+            histogram[bisect_right(JITTER_BINS_US, (now - next_ns) // 1000)] += 1
+            buffer[pos] = now
+            buffer[pos + 1] = x
+            buffer[pos + 2] = y
+            pos += 3
+            self.samples += 1
+            if pos == end:
+                self.full.put((chunk, self.chunk_size))
+                # 写线程落后时这里会等待空闲的 chunk
+                chunk = self.free.get()
+                pos = chunk * self.chunk_size * 3
+                end = pos + self.chunk_size * 3
+
+            next_ns += period_ns
+            # 错过了整个周期就跳过, 不连续补采
+            if now - next_ns > period_ns:
+                skipped = (now - next_ns) // period_ns
+                next_ns += skipped * period_ns
+                self.missed += skipped
+
+        self.elapsed_ns = time.perf_counter_ns() - start_ns
+        self.full.put((chunk, (pos - chunk * self.chunk_size * 3) // 3))
+        self.full.put(None)
+        writer.join()
+
+    def _write(self):
+        view = memoryview(self.buffer)
+        with open(self.filename, "wb") as f:
+            while True:
+                item = self.full.get()
+                if item is None:
+                    break
+                chunk, count = item
+                start = chunk * self.chunk_size * 3
+                f.write(view[start : start + count * 3])
+                self.free.put(chunk)
+
+    def report(self):
+        rate = self.samples / (self.elapsed_ns / 1e9) if self.elapsed_ns else 0
+        print(f"Mouse samples: {self.samples} at {rate:.1f} Hz, {self.missed} missed")
+        lower = 0
+        for upper, count in zip(JITTER_BINS_US + [None], self.histogram):
+            label = f"{lower}-{upper} us" if upper else f">{lower} us"
+            print(f"  {label:>14}: {count}")
+            lower = upper
+
+
+def read_samples(filename, chunk_size=4096):
+    # 逐块读出 MouseSampler 的二进制文件, 每个样本是 (perf_counter_ns, x, y)
+    with open(filename, "rb") as f:
+        while True:
+            data = f.read(8 * 3 * chunk_size)
+            if not data:
+                break
+            samples = array("d")
+            samples.frombytes(data[: len(data) // 24 * 24])
+            for i in range(0, len(samples), 3):
+                yield samples[i], samples[i + 1], samples[i + 2]
 
 
 class ScreenRecorder:
     def __init__(self, video_folder, resolution_string, thread_queue_size=512):
         self.video_folder = video_folder
         self.resolution_string = resolution_string
+        self.encoder = load_profile()
         self.thread_queue_size = str(thread_queue_size)
         self.stop_event = threading.Event()
-        self.video_start_time = datetime.now()
+        self.video_start_ns = time.perf_counter_ns()
         self.current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.screen_device = None
+        self.samples_file = os.path.join(
+            self.video_folder, f"mouse_positions_{self.current_time}.bin"
+        )
 
     def record_screen(self):
         filename = os.path.join(self.video_folder, f"screen_{self.current_time}.mp4")
 
-        # 根据操作系统确定屏幕捕捉方法和命令行参数
-        if platform.system() == "Windows":
-            command = [
-                "ffmpeg",
-                "-f",
-                "gdigrab",
-                "-framerate",
-                "30",
-                "-thread_queue_size",
-                self.thread_queue_size,
-                "-i",
-                "desktop",
-                "-vf",
-                self.resolution_string,
-                "-vcodec",
-                "libx264",
-                "-r",
-                "30",
-                "-crf",
-                "30",
-                "-preset",
-                "ultrafast",
-                "-y",
-                filename,
-            ]
-        elif platform.system() == "Darwin":
-            # 在 macOS 上自动选择屏幕捕捉设备
-            if not self.screen_device:
-                process = subprocess.Popen(
-                    [
-                        "ffmpeg",
-                        "-f",
-                        "avfoundation",
-                        "-list_devices",
-                        "true",
-                        "-i",
-                        '""',
-                    ],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                )
-                devices_output, _ = process.communicate()
-                devices_output = devices_output.decode("utf-8")
-                lines = devices_output.split("\n")
-                for line in lines:
-                    if "Capture screen" in line:
-                        self.screen_device = re.findall(r"\[(.*?)\]", line)[1]
-                        print(f"Screen capture device found: {self.screen_device}")
-                        break
-
-                if self.screen_device is None:
-                    raise RuntimeError("No screen capture device found.")
-
-            command = [
-                "ffmpeg",
-                "-f",
-                "avfoundation",
-                "-framerate",
-                "60",
-                "-capture_cursor",
-                "1",
-                "-i",
-                self.screen_device,
-                "-vf",
-                self.resolution_string,
-                "-vcodec",
-                "h264_videotoolbox",
-                "-r",
-                "60",
-                "-crf",
-                "30",
-                "-preset",
-                "ultrafast",
-                "-y",
-                filename,
-            ]
-        else:  # 假定为 Linux
-            command = [
-                "ffmpeg",
-                "-f",
-                "x11grab",
-                "-framerate",
-                "30",
-                "-capture_cursor",
-                "1",
-                "-i",
-                ":0.0",
-                "-vf",
-                self.resolution_string,
-                "-vcodec",
-                "libx264",
-                "-r",
-                "30",
-                "-crf",
-                "30",
-                "-preset",
-                "ultrafast",
-                "-y",
-                filename,
-            ]
-
-        # 在 Windows 上隐藏 ffmpeg 的控制台窗口
-        if platform.system() == "Windows":
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            process = subprocess.Popen(
-                command,
-                stdin=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                startupinfo=startupinfo,
-            )
-        else:
-            process = subprocess.Popen(
-                command, stdin=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-
-        # 等待录制开始
-        while True:
-            line = process.stderr.readline().decode("utf-8")
-            if "frame" in line:
-                print("Recording started.")
-                video_start_time = datetime.now()
-                self.video_start_time = video_start_time
-                break
+        capture = Capture(
+            get_backend(thread_queue_size=self.thread_queue_size),
+            self.encoder,
+            self.resolution_string,
+            ["-y", filename],
+            on_first_frame=self.on_video_start,
+        )
+        capture.start()
 
         # 等待录制停止的信号
         while not self.stop_event.is_set():
             time.sleep(1)
 
-        # 发送 'q' 信号给 ffmpeg 进程,正常结束录制
-        process.communicate(input="q".encode())
-
-        # 等待 ffmpeg 进程完成
-        process.wait()
+        capture.stop()
 
         print("Recording stopped.")
 
-    def relative_time(self):
-        return (datetime.now() - self.video_start_time).total_seconds()
+    def on_video_start(self, video_start_ns):
+        self.video_start_ns = video_start_ns
 
     def record_mouse_position(self):
         print("Recording mouse position started.")
-        mouse_positions = []
-
-        while not self.stop_event.is_set():
-            x, y = pyautogui.position()
-            timestamp = self.relative_time()
-            mouse_positions.append(f"{timestamp},{x},{y}")
-            time.sleep(0.001)  # 每毫秒记录一次鼠标位置
-
+        sampler = MouseSampler(self.samples_file)
+        sampler.run(self.stop_event)  # 每毫秒记录一次鼠标位置
         print("Recording mouse position stopped.")
-        self.save_mouse_positions(mouse_positions)
+        sampler.report()
+        self.save_mouse_positions()
 
-    def save_mouse_positions(self, mouse_positions):
+    def save_mouse_positions(self):
+        # 把二进制样本转换成和以前一样的 CSV, 时间相对视频开始
         filename = os.path.join(
             self.video_folder, f"mouse_positions_{self.current_time}.csv"
         )
         with open(filename, "w") as file:
             file.write("timestamp,x,y\n")
-            file.write("\n".join(mouse_positions))
+            for t, x, y in read_samples(self.samples_file):
+                timestamp = (t - self.video_start_ns) / 1e9
+                file.write(f"{timestamp},{int(x)},{int(y)}\n")
         print(f"Mouse positions saved to {filename}")
 
     def start_recording(self):
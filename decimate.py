@@ -0,0 +1,130 @@
+import math
+
+# 采集端的鼠标轨迹抽稀。每个 decimator 逐点处理 (time, x, y), push() 返回需要
+# 写入日志的点或 None; flush() 交出被暂时压住的最后一个点, 在点击/滚动等事件
+# 之前以及保存日志时调用, 保证轨迹端点不丢且事件顺序不变。坐标单位是像素,
+# 时间单位由 ticks_per_second 给出 (Recorder 传入 perf_counter_ns)。
+
+
+class RateDecimator:
+    # 固定最大采样率: 两个输出点之间至少间隔 1 / max_rate 秒
+    def __init__(self, max_rate, ticks_per_second=1.0):
+        self.min_interval = ticks_per_second / max_rate
+        self.last_time = None
+        self.pending = None
+
+    def push(self, t, x, y):
+        if self.last_time is None or t - self.last_time >= self.min_interval:
+            self.last_time = t
+            self.pending = None
+            return (t, x, y)
+        self.pending = (t, x, y)
+        return None
+
+    def flush(self):
+        point = self.pending
+        if point is not None:
+            self.last_time = point[0]
+            self.pending = None
+        return point
+
+
+class DistanceDecimator:
+    # 最小距离门限: 离上一个输出点不足 min_distance 像素的点先压住不写。
+    # v2i 按时间在相邻日志点之间线性插值, 所以和 RDPDecimator 一样用同步
+    # 距离检查压住的点: 一旦某个点偏离 上一个输出点->新点 上同一时刻的位置
+    # 超过 min_distance, 就先输出压住的最后一个点。重建误差不超过 min_distance。
+    def __init__(self, min_distance, max_window=256):
+        self.min_distance = min_distance
+        self.max_window = max_window
+        self.last = None
+        self.window = []
+
+    def push(self, t, x, y):
+        last = self.last
+        if last is None:
+            self.last = (t, x, y)
+            return self.last
+
+        point = (t, x, y)
+        for p in self.window:
+            if sync_distance(p, last, point) > self.min_distance:
+                self.last = self.window[-1]
+                self.window = [point]
+                return self.last
+
+        if math.hypot(x - last[1], y - last[2]) >= self.min_distance:
+            self.last = point
+            self.window = []
+            return point
+
+        self.window.append(point)
+        if len(self.window) >= self.max_window:
+            return self.flush()
+        return None
+
+    def flush(self):
+        if not self.window:
+            return None
+        self.last = self.window[-1]
+        self.window = []
+        return self.last
+
+
+def sync_distance(p, a, b):
+    # 同步欧氏距离: p 到 a->b 上与 p 同一时刻的插值位置的距离, 也就是按时间
+    # 插值重建时 p 的误差
+    t, px, py = p
+    ta, ax, ay = a
+    tb, bx, by = b
+    u = (t - ta) / (tb - ta) if tb != ta else 0.0
+    return math.hypot(px - (ax + u * (bx - ax)), py - (ay + u * (by - ay)))
+
+
+class RDPDecimator:
+    # Ramer–Douglas–Peucker 的增量版本 (opening window): 从上一个输出点(锚点)
+    # 出发不断延长线段, 一旦窗口内有点的同步距离 (见 sync_distance) 超过
+    # epsilon, 就输出窗口最后一个点作为新锚点。每个被丢弃的点都已经和最终
+    # 所在的那段比较过, 按时间插值重建的误差不超过 epsilon。
+    # max_window 限制窗口长度, 使每个事件的开销有上界。
+    def __init__(self, epsilon, max_window=256):
+        self.epsilon = epsilon
+        self.max_window = max_window
+        self.anchor = None
+        self.window = []
+
+    def push(self, t, x, y):
+        anchor = self.anchor
+        if anchor is None:
+            self.anchor = (t, x, y)
+            return self.anchor
+
+        point = (t, x, y)
+        for p in self.window:
+            if sync_distance(p, anchor, point) > self.epsilon:
+                self.anchor = self.window[-1]
+                self.window = [point]
+                return self.anchor
+
+        self.window.append(point)
+        if len(self.window) >= self.max_window:
+            return self.flush()
+        return None
+
+    def flush(self):
+        if not self.window:
+            return None
+        point = self.window[-1]
+        self.anchor = point
+        self.window = []
+        return point
+
+
+def create_decimator(mode, value, ticks_per_second=1.0):
+    if mode == "rate":
+        return RateDecimator(value, ticks_per_second)
+    if mode == "distance":
+        return DistanceDecimator(value)
+    if mode == "rdp":
+        return RDPDecimator(value)
+    raise ValueError(f"Unknown decimation mode: {mode}")
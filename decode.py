@@ -0,0 +1,150 @@
+import queue
+import shutil
+import subprocess
+import threading
+import cv2
+import numpy as np
+
+_STOP = object()
+
+
+class FrameReader:
+    # 在后台线程里解码, 通过有界队列预取 prefetch 帧, 解码和匹配互不等待。
+    # 逐帧产出 (帧序号, 灰度图, 彩色图); color=False 时彩色图为 None。
+    #
+    # backend="ffmpeg" 用 rawvideo 管道直接输出 gray 像素格式, 只要亮度分量,
+    # 不做任何颜色转换; "opencv" 用 cv2.VideoCapture 解码 BGR, 在解码线程里
+    # 转灰度。默认只要灰度且有 ffmpeg 时用 ffmpeg。
+    def __init__(
+        self, video_path, start=0, stop=None, color=False, prefetch=16, backend=None
+    ):
+        self.video_path = video_path
+        self.start = start
+        self.stop = stop
+        self.color = color
+        cap = cv2.VideoCapture(video_path)
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+        if backend is None:
+            backend = "ffmpeg" if not color and shutil.which("ffmpeg") else "opencv"
+        if backend not in ("ffmpeg", "opencv"):
+            raise ValueError(f"Unknown decode backend: {backend}")
+        self.backend = backend
+        self.queue = queue.Queue(prefetch)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # 提前结束时取空队列, 让阻塞在 put 上的解码线程退出
+        self.stopped.set()
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.thread.join()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        frames = self._ffmpeg() if self.backend == "ffmpeg" else self._opencv()
+        try:
+            frame_index = self.start
+            for gray, color in frames:
+                if self.stop is not None and frame_index >= self.stop:
+                    break
+                if not self._put((frame_index, gray, color)):
+                    break
+                frame_index += 1
+        except Exception as e:
+            self._put(e)
+        finally:
+            frames.close()
+        self._put(_STOP)
+
+    def _opencv(self):
+        cap = cv2.VideoCapture(self.video_path)
+        if self.start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, self.start)
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                yield gray, frame if self.color else None
+        finally:
+            cap.release()
+
+    def _ffmpeg(self):
+        command = ["ffmpeg", "-v", "error", "-nostdin"]
+        if self.start:
+            # 录屏是恒定帧率, 按时间精确定位到第 start 帧
+            command += ["-ss", f"{self.start / self.fps:.6f}"]
+        command += [
+            "-i",
+            self.video_path,
+            "-map",
+            "0:v:0",
+            "-vsync",
+            "passthrough",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "bgr24" if self.color else "gray",
+            "pipe:1",
+        ]
+        channels = 3 if self.color else 1
+        frame_bytes = self.width * self.height * channels
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, bufsize=frame_bytes * 2
+        )
+        try:
+            while True:
+                frame = np.empty(frame_bytes, np.uint8)
+                if not read_exactly(process.stdout, frame):
+                    break
+                if self.color:
+                    frame = frame.reshape(self.height, self.width, 3)
+                    yield cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), frame
+                else:
+                    yield frame.reshape(self.height, self.width), None
+        finally:
+            process.kill()
+            process.wait()
+
+
+def read_exactly(f, array):
+    # 管道一次可能只给出一部分数据, 读满整帧才返回 True
+    view = memoryview(array)
+    while len(view):
+        n = f.readinto(view)
+        if not n:
+            return False
+        view = view[n:]
+    return True
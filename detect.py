@@ -1,25 +1,78 @@
 import json
+import functools
 import threading
 from pynput import keyboard, mouse
 from datetime import datetime
-import subprocess
 import os
-import pyautogui
 import time
-import platform
-import re
+from actionlog import (
+    ActionLogWriter,
+    NS_PER_SECOND,
+    SegmentedLogWriter,
+    rebase_event,
+)
+from display import DisplayGeometry
+from decimate import create_decimator
+from scheduler import Scheduler
+from framemap import FrameMap
+from encoder import load_profile
+from capture import Capture, get_backend
+
+SCROLL_TIMEOUT = 0.5
+KEYBOARD_TIMEOUT = 5
+
+
+def synchronized(method):
+    # 监听器线程和调度线程共用缓冲区, 回调之间互斥
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        with self.lock:
+            return method(self, *args)
+
+    return wrapper
 
 
 class Recorder:
-    def __init__(self, selected_folder, resolution, thread_queue_size=None):
-        self.init(selected_folder, resolution, thread_queue_size)
+    def __init__(
+        self,
+        selected_folder,
+        resolution=None,
+        thread_queue_size=None,
+        log_format="json",
+        decimation=None,
+        segment_duration=None,
+    ):
+        self.init(
+            selected_folder,
+            resolution,
+            thread_queue_size,
+            log_format,
+            decimation,
+            segment_duration,
+        )
 
-    def init(self, selected_folder, resolution, thread_queue_size):
+    def init(
+        self,
+        selected_folder,
+        resolution,
+        thread_queue_size,
+        log_format="json",
+        decimation=None,
+        segment_duration=None,
+    ):
+        if segment_duration and log_format != "jsonl":
+            raise ValueError("Segmented recording requires log_format='jsonl'.")
+        # 编码参数来自 encoder.py 基准测试保存的本机配置, 没有时用默认值;
+        # resolution 为 None 时输出高度也按配置
+        self.encoder = load_profile()
+        resolution = resolution or self.encoder["height"] or 720
         self.resolution_string = f"scale=-1:{resolution}"
         self.video_folder = os.path.join(selected_folder, "videos")
         self.log_folder = os.path.join(selected_folder, "logs")
         self.current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        self.video_start_time = datetime.now()
+        # 事件时间戳记录为 time.perf_counter_ns() 的原始整数, 只保存一次视频开始
+        # 的锚点, 序列化时再换算成相对视频开始的秒数
+        self.video_start_ns = time.perf_counter_ns()
         self.action_log = []
         self.keyboard_buffer = ""
         self.last_key_time = None
@@ -35,177 +88,133 @@ class Recorder:
         self.stop_event = threading.Event()
         self.keyboard_listener = None
         self.mouse_listener = None
-        self.screen_device = None
         self.drag_start = None
         self.last_mouse_position = None
+        self.drag_button = None
+        self.lock = threading.RLock()
+        # 滚动/键盘缓冲区的超时都由同一个调度线程处理
+        self.scheduler = Scheduler()
+        self.frame_map = FrameMap()
         self.thread_queue_size = thread_queue_size
+        self.log_format = log_format
+        self.geometry = DisplayGeometry()
+        # decimation 形如 ("rate", 60) / ("distance", 3) / ("rdp", 2), 单位 Hz 或像素
+        self.decimator = (
+            create_decimator(*decimation, ticks_per_second=NS_PER_SECOND)
+            if decimation
+            else None
+        )
+        self.move_count = 0
+        self.move_logged = 0
+        # 设置后由同一个 ffmpeg 进程按 segment_duration 秒滚动写出分段视频,
+        # 动作日志在分段边界处切分, 不需要重启 ffmpeg 和监听器
+        self.segment_duration = segment_duration
+        self.segment_list = os.path.join(
+            self.log_folder, f"segments_{self.current_time}.csv"
+        )
+        self.segments = []  # 已结束分段的 (start, end), 单位秒
 
         # Initialize record folders
         os.makedirs(self.video_folder, exist_ok=True)
         os.makedirs(self.log_folder, exist_ok=True)
 
-    def relative_time(self):
-        return (datetime.now() - self.video_start_time).total_seconds()
-
     def record_screen(self):
         filename = os.path.join(self.video_folder, f"screen_{self.current_time}.mp4")
-
-        # 根据操作系统确定屏幕捕捉方法和命令行参数
-        if platform.system() == "Windows":
-            command = [
-                "ffmpeg",
+        output_args = ["-y", filename]
+        if self.segment_duration:
+            output_args = [
+                "-force_key_frames",
+                f"expr:gte(t,n_forced*{self.segment_duration})",
                 "-f",
-                "gdigrab",
-                "-framerate",
-                "30",
-                "-thread_queue_size",
-                self.thread_queue_size,
-                "-i",
-                "desktop",
-                "-vf",
-                self.resolution_string,
-                "-vcodec",
-                "libx264",
-                "-r",
-                "30",
-                "-crf",
-                "30",
-                "-preset",
-                "ultrafast",
-                "-y",
-                filename,
-            ]
-        elif platform.system() == "Darwin":
-            # 在 macOS 上自动选择屏幕捕捉设备
-            if not self.screen_device:
-                process = subprocess.Popen(
-                    [
-                        "ffmpeg",
-                        "-f",
-                        "avfoundation",
-                        "-list_devices",
-                        "true",
-                        "-i",
-                        '""',
-                    ],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                )
-                devices_output, _ = process.communicate()
-                devices_output = devices_output.decode("utf-8")
-                lines = devices_output.split("\n")
-                for line in lines:
-                    if "Capture screen" in line:
-                        self.screen_device = re.findall(r"\[(.*?)\]", line)[1]
-                        print(f"Screen capture device found: {self.screen_device}")
-                        break
-
-                if self.screen_device is None:
-                    raise RuntimeError("No screen capture device found.")
-
-            command = [
-                "ffmpeg",
-                "-f",
-                "avfoundation",
-                "-framerate",
-                "60",
-                "-capture_cursor",
-                "1",
-                "-i",
-                self.screen_device,
-                "-vf",
-                self.resolution_string,
-                "-vcodec",
-                "h264_videotoolbox",
-                "-r",
-                "60",
-                "-crf",
-                "30",
-                "-preset",
-                "ultrafast",
-                "-y",
-                filename,
-            ]
-        else:  # 假定为 Linux
-            command = [
-                "ffmpeg",
-                "-f",
-                "x11grab",
-                "-framerate",
-                "30",
-                "-capture_cursor",
+                "segment",
+                "-segment_time",
+                str(self.segment_duration),
+                "-reset_timestamps",
                 "1",
-                "-i",
-                ":0.0",
-                "-vf",
-                self.resolution_string,
-                "-vcodec",
-                "libx264",
-                "-r",
-                "30",
-                "-crf",
-                "30",
-                "-preset",
-                "ultrafast",
-                "-y",
-                filename,
+                "-segment_format",
+                "mp4",
+                "-segment_list",
+                self.segment_list,
+                "-segment_list_type",
+                "csv",
+                "-segment_list_flags",
+                "+live",
+                os.path.join(self.video_folder, f"screen_{self.current_time}_%03d.mp4"),
             ]
 
-        # 在 Windows 上隐藏 ffmpeg 的控制台窗口
-        if platform.system() == "Windows":
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            process = subprocess.Popen(
-                command,
-                stdin=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                startupinfo=startupinfo,
-            )
-        else:
-            process = subprocess.Popen(
-                command, stdin=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-
-        # 等待录制开始
-        while True:
-            line = process.stderr.readline().decode("utf-8")
-            if "frame" in line:
-                print("Recording started.")
-                video_start_time = datetime.now()
-                self.renew_time(self.video_start_time, video_start_time)
-                self.video_start_time = video_start_time
-                break
+        capture = Capture(
+            get_backend(thread_queue_size=self.thread_queue_size),
+            self.encoder,
+            self.resolution_string,
+            output_args,
+            self.frame_map,
+            self.on_video_start,
+        )
+        capture.start()
 
         # 等待录制停止的信号
+        segments_read = 0
         while not self.stop_event.is_set():
             time.sleep(1)
+            if self.segment_duration:
+                segments_read = self.read_segments(segments_read)
 
-        # 发送 'q' 信号给 ffmpeg 进程,正常结束录制
-        process.communicate(input="q".encode())
-
-        # 等待 ffmpeg 进程完成
-        process.wait()
+        capture.stop()
+        if self.segment_duration:
+            self.read_segments(segments_read)
+        self.save_frame_map()
 
         print("Recording stopped.")
 
-    def renew_time(self, old_time, new_time):
-        for action in self.action_log:
-            if "time" in action:
-                action["time"] = action["time"] - (old_time - new_time).total_seconds()
-            else:
-                action["start_time"] = (
-                    action["start_time"] - (old_time - new_time).total_seconds()
-                )
-                action["end_time"] = (
-                    action["end_time"] - (old_time - new_time).total_seconds()
-                )
+    def read_segments(self, segments_read):
+        # segment list 每结束一个分段追加一行 "文件名,开始时间,结束时间"
+        if not os.path.exists(self.segment_list):
+            return segments_read
+        with open(self.segment_list, "r") as f:
+            lines = [line for line in f.read().split("\n")[:-1] if line]
+        for line in lines[segments_read:]:
+            name, start, end = line.rsplit(",", 2)
+            print(f"Segment finished: {name}")
+            self.segments.append((float(start), float(end)))
+            self.action_log.add_segment(float(start), float(end))
+        return len(lines)
+
+    def on_video_start(self, video_start_ns):
+        self.video_start_ns = video_start_ns
+        if isinstance(self.action_log, ActionLogWriter):
+            self.action_log.set_anchor(self.video_start_ns)
+
+    def save_frame_map(self):
+        if not self.frame_map.frame:
+            return
+        filename = os.path.join(self.log_folder, f"frames_{self.current_time}.json")
+        self.frame_map.save(filename, self.video_start_ns)
+        # 分段录制时每个分段再存一份, 和 SegmentedLogWriter 一样以分段开始为
+        # 时间零点, 与 log_<时间>_000.jsonl 对应的是 frames_<时间>_000.json。
+        # 输出是恒定帧率, 分段的第一帧就是 start * fps
+        for index, (start, end) in enumerate(self.segments):
+            start_ns = self.video_start_ns + int(start * NS_PER_SECOND)
+            end_ns = self.video_start_ns + int(end * NS_PER_SECOND)
+            self.frame_map.segment(
+                start_ns, end_ns, round(start * self.encoder["fps"])
+            ).save(
+                os.path.join(
+                    self.log_folder, f"frames_{self.current_time}_{index:03d}.json"
+                ),
+                start_ns,
+            )
+        print(
+            f"Frame map saved: {self.frame_map.frame[-1]} frames, "
+            f"{self.frame_map.dup[-1]} duplicated, {self.frame_map.drop[-1]} dropped."
+        )
 
+    @synchronized
     def clean_buffer(self, buffer_type):
-        action_time = self.relative_time()
+        action_time = time.perf_counter_ns()
         if buffer_type == "keyboard":
             if (
                 self.last_key_time
-                and (datetime.now() - self.last_key_time).total_seconds() > 5
+                and time.perf_counter_ns() - self.last_key_time > 5 * NS_PER_SECOND
                 and self.keyboard_buffer
             ):
                 self.action_log.append(
@@ -221,7 +230,7 @@ class Recorder:
         elif buffer_type == "scroll":
             if (
                 self.last_scroll_time
-                and (datetime.now() - self.last_scroll_time).total_seconds() > 5
+                and time.perf_counter_ns() - self.last_scroll_time > 5 * NS_PER_SECOND
                 and self.scroll_buffer
             ):
                 self.action_log.append(
@@ -238,8 +247,23 @@ class Recorder:
                 self.scroll_direction = None
                 self.scroll_start_time = None
 
+    @synchronized
+    def flush_keyboard(self):
+        if self.keyboard_buffer:
+            self.action_log.append(
+                {
+                    "start_time": self.keyboard_start_time,
+                    "end_time": time.perf_counter_ns(),
+                    "type": "keypress",
+                    "keys": self.keyboard_buffer,
+                }
+            )
+            self.keyboard_buffer = ""
+            self.keyboard_start_time = None
+
+    @synchronized
     def on_press(self, key):
-        action_time = self.relative_time()
+        action_time = time.perf_counter_ns()
         # print("\nKey pressed: {0}\n".format(str(key)))
         try:
             # print("Key.char: {0}".format(key.char))
@@ -247,7 +271,8 @@ class Recorder:
             if not self.keyboard_start_time:
                 self.keyboard_start_time = action_time
             self.keyboard_buffer += key.char
-            self.last_key_time = datetime.now()
+            self.last_key_time = time.perf_counter_ns()
+            self.scheduler.schedule("keyboard", KEYBOARD_TIMEOUT, self.flush_keyboard)
         except Exception as e:
             self.clean_buffer("keyboard")
             if self.keyboard_buffer:
@@ -268,12 +293,24 @@ class Recorder:
                     "key": str(key),
                 }
             )
-            self.last_key_time = datetime.now()
+            self.last_key_time = time.perf_counter_ns()
 
+    @synchronized
     def on_move(self, x, y):
-        action_time = self.relative_time()
-        width, height = pyautogui.size()
-        current_position = {"x": x / width, "y": y / height}
+        action_time = time.perf_counter_ns()
+        self.last_mouse_position = (x, y)
+        self.move_count += 1
+        if self.decimator is not None:
+            point = self.decimator.push(action_time, x, y)
+            if point is None:
+                return
+            action_time, x, y = point
+        self.log_move(action_time, x, y)
+
+    def log_move(self, action_time, x, y):
+        sx, sy = self.geometry.scale
+        current_position = {"x": x * sx, "y": y * sy}
+        self.move_logged += 1
 
         self.action_log.append(
             {
@@ -283,26 +320,41 @@ class Recorder:
             }
         )
 
+    def flush_moves(self):
+        if self.decimator is not None:
+            point = self.decimator.flush()
+            if point is not None:
+                self.log_move(*point)
+
+    def decimation_stats(self):
+        return {
+            "mouse_move": self.move_count,
+            "logged": self.move_logged,
+            "dropped": self.move_count - self.move_logged,
+        }
+
+    @synchronized
     def on_click(self, x, y, button, pressed):
-        action_time = self.relative_time()
+        action_time = time.perf_counter_ns()
+        self.flush_moves()
         self.clean_buffer("keyboard")
         self.clean_buffer("scroll")
         # print("\nMouse clicked: {0}, {1}, {2}, {3}\n".format(x, y, button, pressed))
-        width, height = pyautogui.size()
-        action_time = action_time
+        sx, sy = self.geometry.scale
 
         if pressed:
             self.mouse_pressed = True
             self.click_start_time = action_time
             self.drag_start = {
-                "x": x / width,
-                "y": y / height,
+                "x": x * sx,
+                "y": y * sy,
                 "start_time": action_time,
             }
+            self.drag_button = button
         else:
             self.mouse_pressed = False
             if self.drag_start:
-                drag_end = {"x": x / width, "y": y / height, "end_time": action_time}
+                drag_end = {"x": x * sx, "y": y * sy, "end_time": action_time}
                 if (
                     abs(self.drag_start["x"] - drag_end["x"]) > 0.01
                     or abs(self.drag_start["y"] - drag_end["y"]) > 0.01
@@ -322,18 +374,27 @@ class Recorder:
                             "time": action_time,
                             "type": "click",
                             "button": str(button),
-                            "position": {"x": x / width, "y": y / height},
+                            "position": {"x": x * sx, "y": y * sy},
                         }
                     )
                 self.drag_start = None
                 self.click_start_time = None
 
+    @synchronized
+    def finalize_drag(self):
+        # 拖拽一直保持到松开, 只有停止录制时还没松开才按最后的鼠标位置结束
+        if self.drag_start and self.last_mouse_position:
+            x, y = self.last_mouse_position
+            self.on_click(x, y, self.drag_button, False)
+
+    @synchronized
     def on_scroll(self, x, y, dx, dy):
-        action_time = self.relative_time()
+        action_time = time.perf_counter_ns()
+        self.flush_moves()
         # print("\nMouse scrolled: {0}, {1}, {2}, {3}\n".format(x, y, dx, dy))
         self.clean_buffer("keyboard")
-        width, height = pyautogui.size()
-        current_position = {"x": x / width, "y": y / height}
+        sx, sy = self.geometry.scale
+        current_position = {"x": x * sx, "y": y * sy}
         current_direction = 1 if dy > 0 else -1
 
         if self.scroll_position is None or self.scroll_direction is None:
@@ -351,15 +412,14 @@ class Recorder:
             self.scroll_start_time = action_time
 
         self.scroll_buffer.append(dy)
-        self.last_scroll_time = datetime.now()
-        threading.Timer(0.5, self.log_scroll_event).start()
+        self.last_scroll_time = time.perf_counter_ns()
+        # 每次滚动只是把同一个截止时间往后推, 不再为每一格滚动新建线程
+        self.scheduler.schedule("scroll", SCROLL_TIMEOUT, self.log_scroll_event)
 
+    @synchronized
     def log_scroll_event(self):
-        action_time = self.relative_time()
-        if (
-            self.last_scroll_time
-            and (datetime.now() - self.last_scroll_time).total_seconds() > 0.5
-        ):
+        action_time = time.perf_counter_ns()
+        if self.scroll_buffer:
             total_scroll = sum(self.scroll_buffer)
             if total_scroll != 0:
                 self.action_log.append(
@@ -377,15 +437,46 @@ class Recorder:
             self.scroll_start_time = None
 
     def save_log(self):
+        self.flush_moves()
+        if self.decimator is not None:
+            stats = self.decimation_stats()
+            print(
+                f"Mouse moves: {stats['mouse_move']} seen, "
+                f"{stats['dropped']} dropped by decimation."
+            )
+        if isinstance(self.action_log, ActionLogWriter):
+            self.action_log.close()
+            return
         filename = os.path.join(self.log_folder, f"log_{self.current_time}.json")
         with open(filename, "w") as f:
-            json.dump(self.action_log, f, indent=4)
+            json.dump(
+                [
+                    rebase_event(action, self.video_start_ns)
+                    for action in self.action_log
+                ],
+                f,
+                indent=4,
+            )
 
     def start_recording(self):
+        # "jsonl" 模式下事件由后台线程分批追加写入, 内存占用不随录制时长增长
+        if self.segment_duration:
+            self.action_log = SegmentedLogWriter(
+                os.path.join(self.log_folder, f"log_{self.current_time}_%03d.jsonl"),
+                self.video_start_ns,
+                self.segment_duration,
+            )
+        elif self.log_format == "jsonl":
+            self.action_log = ActionLogWriter(
+                os.path.join(self.log_folder, f"log_{self.current_time}.jsonl"),
+                self.video_start_ns,
+            )
         self.keyboard_listener = keyboard.Listener(on_press=self.on_press)
         self.mouse_listener = mouse.Listener(
             on_click=self.on_click, on_scroll=self.on_scroll, on_move=self.on_move
         )
+        self.geometry.start()
+        self.scheduler.start()
 
         with self.keyboard_listener as kl, self.mouse_listener as ml:
             self.record_thread = threading.Thread(target=self.record_screen)
@@ -398,6 +489,10 @@ class Recorder:
     def stop_recording(self):
         self.stop_event.set()  # 设置停止事件,让录制线程可以优雅地结束
         self.stop_listeners()  # 停止键盘和鼠标监听器
+        self.geometry.stop()
+        # 停止时立即结束还在缓冲的键盘输入和滚动, 以及还没松开的拖拽
+        self.scheduler.stop(run_pending=True)
+        self.finalize_drag()
         if self.record_thread is not None:
             self.record_thread.join()  # Ensure the recording thread has finished
         self.save_log()  # Save log file
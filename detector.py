@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from threading import Thread, Timer
+from threading import Thread
 import webbrowser
 import os
 from detect import Recorder  # 确保 recorder.py 文件和这个文件在同一个目录下
@@ -10,10 +10,9 @@ import platform
 class RecorderGUI:
     def __init__(self, master):
         self.master = master
-        self.recorder = Recorder(os.getcwd(), 720, None)
+        self.recorder = Recorder(os.getcwd(), None, None, log_format="jsonl")
         self.recording_thread = None
-        self.timer = None
-        self.recording_duration = 300  # 默认录制时长,单位为秒
+        self.recording_duration = 300  # 默认分段时长,单位为秒
 
         self.master.title("Screen Recorder")
 
@@ -26,7 +25,7 @@ class RecorderGUI:
         self.resolution_label.pack(side=tk.LEFT)
 
         self.resolution_entry = tk.Entry(self.resolution_frame)
-        self.resolution_entry.insert(0, "720")  # Default resolution
+        # 留空时用 encoder.py 保存的本机配置中的高度, 没有配置时是 720
         self.resolution_entry.pack(side=tk.LEFT)
 
         if platform.system() == "Windows":
@@ -40,7 +39,7 @@ class RecorderGUI:
         self.duration_frame = tk.Frame(master)
         self.duration_frame.pack()
 
-        self.duration_label = tk.Label(self.duration_frame, text="Recording Duration:")
+        self.duration_label = tk.Label(self.duration_frame, text="Segment Duration:")
         self.duration_label.pack(side=tk.LEFT)
 
         self.duration_entry = tk.Entry(self.duration_frame)
@@ -111,7 +110,7 @@ class RecorderGUI:
         try:
             resolution = int(resolution)  # Validate and convert to integer
         except ValueError:
-            resolution = 720  # Default if invalid input
+            resolution = None  # 无效或留空时由 Recorder 按本机配置决定
 
         duration = self.duration_entry.get()
         if duration.isdigit():
@@ -127,16 +126,19 @@ class RecorderGUI:
             else:
                 thread = 256
 
-        self.recorder.init(self.selected_folder.get(), resolution, thread)
+        # 同一个 ffmpeg 进程按时长滚动写出分段, 不再定时重启录制
+        self.recorder.init(
+            self.selected_folder.get(),
+            resolution,
+            thread,
+            log_format="jsonl",
+            segment_duration=self.recording_duration,
+        )
         self.recording_thread = Thread(target=self.recorder.start_recording)
         self.recording_thread.start()
         self.start_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
         self.select_folder_button.config(state=tk.DISABLED)
-        if self.timer is not None:
-            self.timer.cancel()
-        self.timer = Timer(self.recording_duration, self.restart_recording)
-        self.timer.start()
 
     def stop_recording(self):
         if self.recorder is not None:
@@ -147,19 +149,12 @@ class RecorderGUI:
         self.stop_button.config(state=tk.DISABLED)
         self.select_folder_button.config(state=tk.NORMAL)
         self.recording_thread = None
-        if self.timer is not None:
-            self.timer.cancel()
-            self.timer = None
 
     def select_folder(self):
         folder = filedialog.askdirectory()
         if folder:
             self.selected_folder.set(folder)
 
-    def restart_recording(self):
-        self.stop_recording()
-        self.start_recording()
-
 
 def main():
     root = tk.Tk()
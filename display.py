@@ -0,0 +1,46 @@
+import threading
+import pyautogui
+
+
+class DisplayGeometry:
+    # 缓存屏幕尺寸, 输入回调里不再每个事件都调用 pyautogui.size()。
+    # 后台线程低频轮询, 只有分辨率或显示器变化时才替换缓存。
+    def __init__(self, size_func=pyautogui.size, poll_interval=2.0):
+        self.size_func = size_func
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.size = None
+        self.scale = None
+        self.refresh()
+
+    def refresh(self):
+        width, height = self.size_func()
+        if self.size != (width, height):
+            self.size = (width, height)
+            # 回调只读取这一个元组, 替换是原子的
+            self.scale = (1.0 / width, 1.0 / height)
+            return True
+        return False
+
+    def normalize(self, x, y):
+        sx, sy = self.scale
+        return x * sx, y * sy
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._poll, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _poll(self):
+        while not self.stop_event.wait(self.poll_interval):
+            if self.refresh():
+                print(f"Display size changed: {self.size[0]}x{self.size[1]}")
@@ -0,0 +1,222 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CONFIG_FOLDER = os.path.join(os.path.expanduser("~"), ".screen_action_recorder")
+PROFILE_FILE = os.path.join(CONFIG_FOLDER, "encoder_profile.json")
+
+# 从快到慢, 越靠后同样 crf 下压缩率越高
+PRESETS = [
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+]
+
+
+def default_profile():
+    if platform.system() == "Darwin":
+        return {
+            "vcodec": "h264_videotoolbox",
+            "preset": "ultrafast",
+            "crf": 30,
+            "threads": 0,
+            "fps": 60,
+            "height": None,
+        }
+    return {
+        "vcodec": "libx264",
+        "preset": "ultrafast",
+        "crf": 30,
+        "threads": 0,
+        "fps": 30,
+        "height": None,
+    }
+
+
+def load_profile(filename=PROFILE_FILE):
+    profile = default_profile()
+    if os.path.exists(filename):
+        with open(filename, "r") as f:
+            profile.update(json.load(f))
+    return profile
+
+
+def save_profile(profile, filename=PROFILE_FILE):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as f:
+        json.dump(profile, f, indent=4)
+
+
+def encoder_args(profile):
+    # ffmpeg 输出端的编码参数, 三个录制脚本共用
+    return [
+        "-vcodec",
+        profile["vcodec"],
+        "-r",
+        str(profile["fps"]),
+        "-crf",
+        str(profile["crf"]),
+        "-preset",
+        profile["preset"],
+        "-threads",
+        str(profile["threads"]),
+    ]
+
+
+def children_cpu_time():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_candidate(profile, source_size, duration, folder):
+    # 用 lavfi 的 testsrc2 作为输入, 不需要屏幕和 GPU
+    output = os.path.join(folder, "bench.mp4")
+    command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={source_size}:rate={profile['fps']}",
+        "-t",
+        str(duration),
+    ]
+    if profile["height"]:
+        command += ["-vf", f"scale=-2:{profile['height']}"]
+    command += encoder_args(profile) + ["-y", output]
+
+    cpu_before = children_cpu_time()
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdin=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    cpu_after = children_cpu_time()
+
+    frames = duration * profile["fps"]
+    return {
+        "fps_achieved": frames / elapsed,
+        "cpu_seconds": None if cpu_before is None else cpu_after - cpu_before,
+        "bytes_per_second": os.path.getsize(output) / duration,
+    }
+
+
+def candidates(presets, crfs, threads, heights, fps, vcodec):
+    for preset, crf, thread, height in itertools.product(
+        presets, crfs, threads, heights
+    ):
+        yield {
+            "vcodec": vcodec,
+            "preset": preset,
+            "crf": crf,
+            "threads": thread,
+            "fps": fps,
+            "height": height,
+        }
+
+
+def pick_best(results, headroom):
+    # 编码速度至少是目标帧率的 headroom 倍才算跟得上录制; 跟得上的配置里
+    # 选画质最好的 (crf 小、高度大), 再选压缩率高的 (preset 慢、码率低)
+    usable = [r for r in results if r["fps_achieved"] >= r["profile"]["fps"] * headroom]
+    if not usable:
+        return max(results, key=lambda r: r["fps_achieved"])
+    return min(
+        usable,
+        key=lambda r: (
+            r["profile"]["crf"],
+            -(r["profile"]["height"] or 0),
+            -PRESETS.index(r["profile"]["preset"]),
+            r["bytes_per_second"],
+        ),
+    )
+
+
+def benchmark(
+    source_size="1920x1080",
+    duration=5,
+    presets=("ultrafast", "superfast", "veryfast"),
+    crfs=(23, 28, 30),
+    threads=(0,),
+    heights=(720, 1080),
+    fps=None,
+    headroom=1.5,
+    vcodec=None,
+):
+    # 编码器和帧率默认与本平台录制时用的相同 (macOS 上是 h264_videotoolbox、
+    # 60 fps), 只比较 preset/crf/线程数/高度, 保存的配置不会换掉平台的编码器
+    defaults = default_profile()
+    fps = fps or defaults["fps"]
+    vcodec = vcodec or defaults["vcodec"]
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for profile in candidates(presets, crfs, threads, heights, fps, vcodec):
+            result = run_candidate(profile, source_size, duration, folder)
+            result["profile"] = profile
+            results.append(result)
+            cpu = result["cpu_seconds"]
+            print(
+                f"{profile['preset']:>10} crf={profile['crf']:<3} "
+                f"threads={profile['threads']:<2} height={profile['height']:<5} "
+                f"{result['fps_achieved']:8.1f} fps "
+                f"{'-' if cpu is None else f'{cpu:.2f}':>6} cpu-s "
+                f"{result['bytes_per_second'] / 1024:8.1f} KiB/s"
+            )
+    return pick_best(results, headroom), results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark encoder settings and save the best profile"
+    )
+    parser.add_argument("--size", default="1920x1080", help="test source size")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument(
+        "--fps", type=int, help="capture frame rate (default: platform default)"
+    )
+    parser.add_argument("--vcodec", help="encoder (default: platform default)")
+    parser.add_argument(
+        "--presets", nargs="+", default=["ultrafast", "superfast", "veryfast"]
+    )
+    parser.add_argument("--crf", nargs="+", type=int, default=[23, 28, 30])
+    parser.add_argument("--threads", nargs="+", type=int, default=[0])
+    parser.add_argument("--heights", nargs="+", type=int, default=[720, 1080])
+    parser.add_argument("--headroom", type=float, default=1.5)
+    parser.add_argument("--output", default=PROFILE_FILE)
+    args = parser.parse_args()
+
+    best, _ = benchmark(
+        args.size,
+        args.duration,
+        args.presets,
+        args.crf,
+        args.threads,
+        args.heights,
+        args.fps,
+        args.headroom,
+        args.vcodec,
+    )
+    save_profile(best["profile"], args.output)
+    print(f"Best profile saved to {args.output}: {best['profile']}")
+
+
+if __name__ == "__main__":
+    main()
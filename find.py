@@ -1,7 +1,59 @@
 import cv2
+import functools
+import hashlib
+import json
+import math
 import numpy as np
 import os
-import pandas as pd
+import subprocess
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from actionlog import iter_log
+from decode import FrameReader
+from encoder import CONFIG_FOLDER
+from framemap import FrameMap
+from results import DICTIONARY, ResultWriter
+from sinks import make_sink
+
+RESULT_COLUMNS = [
+    ("Frame", np.int64),
+    ("X", np.int32),
+    ("Y", np.int32),
+    ("Width", np.int32),
+    ("Height", np.int32),
+    ("Template", DICTIONARY),
+    ("Confidence", np.float32),
+    ("Carried", np.bool_),
+]
+
+# 搜索区域像素数不小于 crossover 时 "auto" 改用 FFT 匹配。交叉点取决于
+# 机器, 由 python bench_find.py --crossover 测量并保存到 CROSSOVER_FILE;
+# 没有测量结果 (或测得逐像素匹配在所有尺寸上都更快) 时 "auto" 不用 FFT
+CROSSOVER_FILE = os.path.join(CONFIG_FOLDER, "fft_crossover.json")
+
+
+def load_crossover(filename=CROSSOVER_FILE):
+    if os.path.exists(filename):
+        with open(filename, "r") as f:
+            crossover = json.load(f).get("crossover")
+        if crossover is not None:
+            return crossover
+    return math.inf
+
+
+def save_crossover(crossover, filename=CROSSOVER_FILE):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as f:
+        json.dump({"crossover": crossover}, f, indent=4)
+
+
+FFT_CROSSOVER = load_crossover()
+
+# 金字塔匹配缩小 2**PYRAMID_LEVELS 倍粗搜。缩小 4 倍 (2 层) 时 25-41 像素的
+# 光标只剩 6-10 像素, 真实位置的粗匹配分数常常低于背景上的相似图标, 精搜
+# 根本轮不到它; 1 层时 720p 全图搜索与逐像素匹配的结果相同, 仍快 5 倍左右
+PYRAMID_LEVELS = 1
 
 
 def load_templates(template_dir, negative_template_dir):
@@ -33,6 +85,177 @@ def load_templates(template_dir, negative_template_dir):
     return templates, negative_templates
 
 
+class TemplateSet(list):
+    # (模板, 文件名) 列表, 附带编译模板库时算好的统计量, 匹配时直接取用:
+    # coarse 是金字塔各层的缩小模板, zero_mean / norms 供 FFT 匹配使用
+    def __init__(self, items, coarse=None, zero_mean=None, norms=None):
+        super().__init__(items)
+        self.coarse = coarse or {}
+        self.zero_mean = zero_mean
+        self.norms = norms
+
+
+def coarse_templates(templates, levels):
+    coarse = getattr(templates, "coarse", {}).get(levels)
+    if coarse is None:
+        coarse = [downsample(template, levels) for template, _ in templates]
+    return coarse
+
+
+def template_files(directory):
+    return sorted(
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+        if filename.endswith(".png")
+    )
+
+
+class TemplateBank:
+    # 把正负模板编译成一个 .npz 文件。文件里记录源 PNG 的内容哈希, 只有
+    # PNG 变化时才重新解码和计算; 长时间运行的跟踪可以定期调用 refresh()
+    # 热加载修改后的模板。
+    version = 1
+
+    def __init__(
+        self,
+        template_dir,
+        negative_template_dir,
+        filename=None,
+        levels=(PYRAMID_LEVELS,),
+    ):
+        self.template_dir = template_dir
+        self.negative_template_dir = negative_template_dir
+        self.filename = filename or os.path.join(
+            os.path.dirname(os.path.normpath(template_dir)), "templates.npz"
+        )
+        self.levels = tuple(levels)
+        self.signature = None
+        self.digest = None
+        self.templates = TemplateSet([])
+        self.negative_templates = []
+        self.refresh()
+
+    def source_signature(self):
+        # 文件名、大小和修改时间, 没变化时不必重新计算哈希
+        files = template_files(self.template_dir) + template_files(
+            self.negative_template_dir
+        )
+        return [(path, os.path.getsize(path), os.path.getmtime(path)) for path in files]
+
+    def source_digest(self):
+        digest = hashlib.sha256(f"{self.version} {self.levels}".encode())
+        for label, directory in (
+            ("positive", self.template_dir),
+            ("negative", self.negative_template_dir),
+        ):
+            for path in template_files(directory):
+                digest.update(f"{label}/{os.path.basename(path)}".encode())
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    def refresh(self):
+        # 源 PNG 有变化时重新加载, 返回是否加载了新的模板
+        signature = self.source_signature()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        digest = self.source_digest()
+        if digest == self.digest:
+            return False
+        if not self._load(digest):
+            self._compile(digest)
+        return True
+
+    def _load(self, digest):
+        try:
+            with np.load(self.filename) as data:
+                if str(data["digest"]) != digest:
+                    return False
+                names = [str(name) for name in data["names"]]
+                templates = [data[f"positive_{i}"] for i in range(len(names))]
+                negative_templates = [
+                    data[f"negative_{i}"] for i in range(int(data["negative_count"]))
+                ]
+                coarse = {
+                    levels: [data[f"coarse_{levels}_{i}"] for i in range(len(names))]
+                    for levels in self.levels
+                }
+                zero_mean = [data[f"zero_mean_{i}"] for i in range(len(names))]
+                norms = list(data["norms"])
+        except (OSError, KeyError, ValueError):
+            return False
+        self._set(
+            digest, names, templates, negative_templates, coarse, zero_mean, norms
+        )
+        print(f"Loaded {len(names)} templates from {self.filename}")
+        return True
+
+    def _compile(self, digest):
+        names = []
+        templates = []
+        for path in template_files(self.template_dir):
+            template = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if template is None:
+                continue
+            names.append(os.path.basename(path))
+            templates.append(template)
+        negative_templates = [
+            template
+            for template in (
+                cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+                for path in template_files(self.negative_template_dir)
+            )
+            if template is not None
+        ]
+        coarse = {
+            levels: [downsample(template, levels) for template in templates]
+            for levels in self.levels
+        }
+        zero_mean = [
+            template.astype(np.float32) - np.float32(template.mean())
+            for template in templates
+        ]
+        norms = [np.sqrt(np.sum(z.astype(np.float64) ** 2)) for z in zero_mean]
+
+        arrays = {
+            "digest": np.array(digest),
+            "names": np.array(names),
+            "negative_count": np.array(len(negative_templates)),
+            "norms": np.array(norms, np.float64),
+        }
+        for i, template in enumerate(templates):
+            arrays[f"positive_{i}"] = template
+            arrays[f"zero_mean_{i}"] = zero_mean[i]
+            for levels in self.levels:
+                arrays[f"coarse_{levels}_{i}"] = coarse[levels][i]
+        for i, template in enumerate(negative_templates):
+            arrays[f"negative_{i}"] = template
+        # 先写临时文件再替换, 其他进程不会读到写了一半的文件
+        temp = f"{self.filename}.{os.getpid()}.tmp"
+        try:
+            with open(temp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(temp, self.filename)
+        except OSError as e:
+            print(f"Could not save template bank: {e}")
+        self._set(
+            digest, names, templates, negative_templates, coarse, zero_mean, norms
+        )
+        print(
+            f"Compiled {len(names)} templates and {len(negative_templates)} "
+            f"negative templates into {self.filename}"
+        )
+
+    def _set(
+        self, digest, names, templates, negative_templates, coarse, zero_mean, norms
+    ):
+        # 换成新的列表对象, FFTMatcher 据此发现模板变了
+        self.digest = digest
+        self.templates = TemplateSet(zip(templates, names), coarse, zero_mean, norms)
+        self.negative_templates = negative_templates
+
+
 def calculate_overlap(rect1, rect2):
     x1, y1, w1, h1 = rect1
     x2, y2, w2, h2 = rect2
@@ -48,6 +271,667 @@ def calculate_overlap(rect1, rect2):
     return overlap_ratio
 
 
+def overlap_matrix(boxes1, boxes2):
+    # calculate_overlap 的矩阵版本, boxes 为 (N, 4) 的 x, y, w, h
+    x1, y1, w1, h1 = (boxes1[:, i, None] for i in range(4))
+    x2, y2, w2, h2 = (boxes2[None, :, i] for i in range(4))
+
+    overlap_x = np.maximum(0, np.minimum(x1 + w1, x2 + w2) - np.maximum(x1, x2))
+    overlap_y = np.maximum(0, np.minimum(y1 + h1, y2 + h2) - np.maximum(y1, y2))
+    overlap_area = overlap_x * overlap_y
+
+    return overlap_area / np.minimum(w1 * h1, w2 * h2)
+
+
+def max_overlap(boxes, other_boxes, chunk_size=1 << 20):
+    # 每个框与 other_boxes 的最大重叠比例, 分块计算以限制矩阵的内存
+    result = np.zeros(len(boxes))
+    if not len(other_boxes):
+        return result
+    rows = max(1, chunk_size // len(other_boxes))
+    for start in range(0, len(boxes), rows):
+        result[start : start + rows] = overlap_matrix(
+            boxes[start : start + rows], other_boxes
+        ).max(axis=1)
+    return result
+
+
+def nms(boxes, scores, threshold):
+    # 贪心非极大值抑制, 分数相同时保持原顺序, 返回保留的下标 (按分数从高到低)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        order = order[1:]
+        if len(order):
+            order = order[overlap_matrix(boxes[i : i + 1], boxes[order])[0] < threshold]
+    return np.array(keep, np.int64)
+
+
+# 匹配结果以 (模板序号, 响应图, 响应图在搜索区域中的偏移) 的形式逐个生成,
+# 金字塔匹配只生成峰值附近的小块响应图
+def match_exhaustive(search_area, templates):
+    for index, (template, _) in enumerate(templates):
+        if (
+            search_area.shape[0] < template.shape[0]
+            or search_area.shape[1] < template.shape[1]
+        ):
+            continue
+        res = cv2.matchTemplate(search_area, template, cv2.TM_CCOEFF_NORMED)
+        yield index, res, (0, 0)
+
+
+def downsample(image, levels):
+    for _ in range(levels):
+        image = cv2.pyrDown(image)
+    return image
+
+
+def coarse_peaks(res, top_k, radius):
+    # 依次取最大值并抹掉其邻域, 得到 top_k 个互不重叠的峰值
+    res = res.copy()
+    peaks = []
+    for _ in range(top_k):
+        _, max_val, _, (x, y) = cv2.minMaxLoc(res)
+        if max_val <= -1:
+            break
+        peaks.append((x, y))
+        res[
+            max(0, y - radius) : y + radius + 1, max(0, x - radius) : x + radius + 1
+        ] = -1
+    return peaks
+
+
+def match_pyramid(search_area, templates, levels=PYRAMID_LEVELS, top_k=3, margin=3):
+    # 先在缩小 2**levels 倍的图上粗匹配, 再只在每个粗峰值附近的小窗口里用
+    # 原分辨率精确匹配。模板在缩小后太小时退回逐像素匹配。
+    scale = 2**levels
+    coarse_area = downsample(search_area, levels)
+    coarse = coarse_templates(templates, levels)
+    for index, (template, _) in enumerate(templates):
+        th, tw = template.shape[:2]
+        coarse_template = coarse[index]
+        if (
+            min(coarse_template.shape[:2]) < 4
+            or coarse_area.shape[0] < coarse_template.shape[0]
+            or coarse_area.shape[1] < coarse_template.shape[1]
+        ):
+            for _, res, offset in match_exhaustive(search_area, [templates[index]]):
+                yield index, res, offset
+            continue
+
+        coarse_res = cv2.matchTemplate(
+            coarse_area, coarse_template, cv2.TM_CCOEFF_NORMED
+        )
+        radius = max(1, min(coarse_template.shape[:2]) // 2)
+        for x, y in coarse_peaks(coarse_res, top_k, radius):
+            pad = scale + margin
+            x_start = max(0, x * scale - pad)
+            y_start = max(0, y * scale - pad)
+            x_end = min(search_area.shape[1], x * scale + pad + tw)
+            y_end = min(search_area.shape[0], y * scale + pad + th)
+            window = search_area[y_start:y_end, x_start:x_end]
+            if window.shape[0] < th or window.shape[1] < tw:
+                continue
+            res = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            yield index, res, (x_start, y_start)
+
+
+class FFTMatcher:
+    # 用 FFT 计算 TM_CCOEFF_NORMED。模板减去均值后的频谱和范数只算一次并缓存,
+    # 每帧只对搜索区域做一次正变换, 各模板只需频谱相乘和一次逆变换;
+    # 分母中窗口的方差用积分图得到。搜索区域小于 crossover 时 FFT 不划算,
+    # 仍用 cv2.matchTemplate。
+    def __init__(self, crossover=FFT_CROSSOVER, max_shapes=4):
+        self.crossover = crossover
+        self.max_shapes = max_shapes
+        self.templates = None
+        self.zero_mean = []
+        self.norms = []
+        self.spectra = OrderedDict()  # 补零后的尺寸 -> 各模板的频谱 (CCS 格式)
+
+    def prepare(self, templates):
+        if templates is self.templates:
+            return
+        self.templates = templates
+        if getattr(templates, "zero_mean", None) is not None:
+            # 模板库里已经算好了
+            self.zero_mean = templates.zero_mean
+            self.norms = templates.norms
+        else:
+            self.zero_mean = [
+                template.astype(np.float32) - np.float32(template.mean())
+                for template, _ in templates
+            ]
+            self.norms = [
+                np.sqrt(np.sum(z.astype(np.float64) ** 2)) for z in self.zero_mean
+            ]
+        self.spectra.clear()
+
+    def template_spectra(self, shape):
+        if shape in self.spectra:
+            self.spectra.move_to_end(shape)
+            return self.spectra[shape]
+        spectra = []
+        for z in self.zero_mean:
+            padded = np.zeros(shape, np.float32)
+            padded[: z.shape[0], : z.shape[1]] = z
+            spectra.append(cv2.dft(padded, nonzeroRows=z.shape[0]))
+        self.spectra[shape] = spectra
+        if len(self.spectra) > self.max_shapes:
+            self.spectra.popitem(last=False)
+        return spectra
+
+    def __call__(self, search_area, templates):
+        if search_area.size < self.crossover:
+            yield from match_exhaustive(search_area, templates)
+            return
+        self.prepare(templates)
+        height, width = search_area.shape[:2]
+        # 尺寸向上取整到 64 的倍数, 减少需要缓存的频谱种类, 也避开奇数长度
+        shape = tuple(cv2.getOptimalDFTSize(-(-n // 64) * 64) for n in (height, width))
+        padded = np.zeros(shape, np.float32)
+        # 减去均值不影响分子 (模板均值为零), 但能降低 float32 的舍入误差
+        padded[:height, :width] = search_area
+        padded[:height, :width] -= np.float32(search_area.mean())
+        area_spectrum = cv2.dft(padded, nonzeroRows=height)
+        spectra = self.template_spectra(shape)
+        window_sum, window_sqsum = cv2.integral2(search_area, sdepth=cv2.CV_64F)
+
+        for i, (template, _) in enumerate(templates):
+            th, tw = template.shape[:2]
+            rows, cols = height - th + 1, width - tw + 1
+            if rows <= 0 or cols <= 0:
+                continue
+            corr = cv2.idft(
+                cv2.mulSpectrums(area_spectrum, spectra[i], 0, conjB=True),
+                flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE,
+            )
+            # 原地运算, 避免每一步都分配整块新数组
+            variance = box_sum(window_sqsum, th, tw)
+            square = box_sum(window_sum, th, tw)
+            square *= square
+            square /= th * tw
+            variance -= square
+            # 和 cv2 一样, 纯色窗口的结果为 0
+            flat = variance < th * tw * 1e-3
+            np.sqrt(variance, out=variance)
+            variance *= self.norms[i]
+            variance[flat] = np.inf
+            res = corr[:rows, :cols] / variance.astype(np.float32)
+            np.clip(res, -1, 1, out=res)
+            yield i, res, (0, 0)
+
+
+def box_sum(integral, height, width):
+    # 积分图上所有 height x width 窗口的和
+    total = integral[height:, width:] - integral[:-height, width:]
+    total -= integral[height:, :-width]
+    total += integral[:-height, :-width]
+    return total
+
+
+def gradient(image):
+    # Sobel 梯度幅值 (与 test.py 相同)
+    grad_x = cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=3)
+    return cv2.magnitude(grad_x, grad_y)
+
+
+def gradient_response(image, template, integrals=None):
+    # 梯度域的 TM_CCOEFF_NORMED。梯度全为零的平坦窗口上 cv2 的浮点计算
+    # 不稳定, 会给出接近 1 的响应, 这里和纯色灰度窗口一样置为 0。
+    # integrals 是 image 的 integral2, 同一区域匹配多个模板时只算一次
+    res = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    if integrals is None:
+        integrals = cv2.integral2(image, sdepth=cv2.CV_64F)
+    window_sum, window_sqsum = integrals
+    th, tw = template.shape[:2]
+    variance = box_sum(window_sqsum, th, tw)
+    square = box_sum(window_sum, th, tw)
+    square *= square
+    square /= th * tw
+    variance -= square
+    res[variance < th * tw * 1e-2] = 0
+    return res
+
+
+class GradientMatcher:
+    # 在 Sobel 梯度幅值上做 TM_CCOEFF_NORMED。光标的黑白描边在梯度域里很
+    # 突出, 花哨背景上的响应比灰度匹配低, 可以用更高的 threshold_min。
+    # 搜索区域的梯度由 FrameCache 每帧只算一次, 正负模板共用; 模板的梯度
+    # 只在模板列表变化时计算。模板最外一圈的梯度取决于模板外面的背景,
+    # 所以去掉, 只用内部去匹配, 响应图仍按整个模板的左上角排列。
+    domain = "gradient"
+
+    def __init__(self):
+        self.templates = None
+        self.gradients = []
+        self.negative_templates = None
+        self.negative = []
+
+    def template_gradients(self, templates):
+        if templates is not self.templates:
+            self.templates = templates
+            self.gradients = [
+                gradient(template)[1:-1, 1:-1] for template, _ in templates
+            ]
+        return self.gradients
+
+    def negative_gradients(self, negative_templates):
+        if negative_templates is not self.negative_templates:
+            self.negative_templates = negative_templates
+            self.negative = [
+                gradient(template)[1:-1, 1:-1] for template in negative_templates
+            ]
+        return self.negative
+
+    def __call__(self, search_area, templates):
+        inner = search_area[1:-1, 1:-1]
+        integrals = None
+        for index, template in enumerate(self.template_gradients(templates)):
+            if inner.shape[0] < template.shape[0] or inner.shape[1] < template.shape[1]:
+                continue
+            if integrals is None:
+                integrals = cv2.integral2(inner, sdepth=cv2.CV_64F)
+            yield index, gradient_response(inner, template, integrals), (0, 0)
+
+
+MATCHERS = {
+    "exhaustive": match_exhaustive,
+    "pyramid": match_pyramid,
+    "fft": FFTMatcher(crossover=0),
+    "auto": FFTMatcher(),
+    "gradient": GradientMatcher(),
+}
+
+
+class FrameCache:
+    # 同一帧的多次匹配 (ROI 没找到时会再搜全图) 共用灰度图、梯度幅值和负模板
+    # 响应。frame 可以是 BGR 帧, 也可以是解码器直接给出的灰度图
+    def __init__(self, frame):
+        self.gray = (
+            frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        )
+        self.grad = None  # (梯度幅值, 已计算的位置), 用到时才分配
+        self.negative = {}  # (域, 负模板序号) -> (全图响应, 已计算的位置)
+
+    def gradient(self, x_start, y_start, x_end, y_end):
+        # 窗口内的 Sobel 梯度幅值。只计算还没算过的窗口, 向外多取一圈像素,
+        # 结果与对整帧计算一致 (只差浮点舍入)
+        if self.grad is None:
+            self.grad = (
+                np.empty(self.gray.shape, np.float32),
+                np.zeros(self.gray.shape, bool),
+            )
+        grad, done = self.grad
+        if not done[y_start:y_end, x_start:x_end].all():
+            height, width = self.gray.shape
+            y0, x0 = max(0, y_start - 1), max(0, x_start - 1)
+            y1, x1 = min(height, y_end + 1), min(width, x_end + 1)
+            window = gradient(self.gray[y0:y1, x0:x1])
+            grad[y_start:y_end, x_start:x_end] = window[
+                y_start - y0 : y_end - y0, x_start - x0 : x_end - x0
+            ]
+            done[y_start:y_end, x_start:x_end] = True
+        return grad[y_start:y_end, x_start:x_end]
+
+    def negative_response(
+        self, index, template, x_start, y_start, x_end, y_end, domain="gray"
+    ):
+        # 负模板左上角在 [x_start, x_end) x [y_start, y_end) 范围内的响应,
+        # domain="gradient" 时 template 是去掉一圈边的负模板梯度幅值
+        h, w = template.shape[:2]
+        if domain == "gradient":
+            h, w = h + 2, w + 2
+        key = (domain, index)
+        if key not in self.negative:
+            shape = (self.gray.shape[0] - h + 1, self.gray.shape[1] - w + 1)
+            self.negative[key] = (
+                np.empty(shape, np.float32),
+                np.zeros(shape, bool),
+            )
+        res, done = self.negative[key]
+        if not done[y_start:y_end, x_start:x_end].all():
+            if domain == "gradient":
+                window = self.gradient(
+                    x_start + 1, y_start + 1, x_end + w - 2, y_end + h - 2
+                )
+                response = gradient_response(window, template)
+            else:
+                window = self.gray[y_start : y_end + h - 1, x_start : x_end + w - 1]
+                response = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            res[y_start:y_end, x_start:x_end] = response
+            done[y_start:y_end, x_start:x_end] = True
+        return res[y_start:y_end, x_start:x_end]
+
+
+def negative_windows(candidates, size, bounds, cell=16):
+    # 只有左上角落在候选框附近的负模板匹配才可能与候选框重叠。把每个候选
+    # 对应的范围画到以 cell 像素为单位的粗网格上再取连通区域, 挨在一起的
+    # 候选共用一个窗口, 网格很小, 开销与画面面积基本无关。
+    # bounds 是负模板左上角在搜索区域内的合法范围 [x0, x1) x [y0, y1)。
+    h, w = size
+    x0, y0, x1, y1 = bounds
+    if x1 <= x0 or y1 <= y0:
+        return []
+    xs = np.clip(candidates[:, 0] - w + 1, x0, x1) - x0
+    xe = np.clip(candidates[:, 0] + candidates[:, 2], x0, x1) - x0
+    ys = np.clip(candidates[:, 1] - h + 1, y0, y1) - y0
+    ye = np.clip(candidates[:, 1] + candidates[:, 3], y0, y1) - y0
+    valid = (xs < xe) & (ys < ye)
+    if not valid.any():
+        return []
+    xs, ys = xs[valid] // cell, ys[valid] // cell
+    xe, ye = -(-xe[valid] // cell), -(-ye[valid] // cell)
+
+    rows, cols = -(-(y1 - y0) // cell), -(-(x1 - x0) // cell)
+    diff = np.zeros((rows + 1, cols + 1), np.int32)
+    np.add.at(diff, (ys, xs), 1)
+    np.add.at(diff, (ys, xe), -1)
+    np.add.at(diff, (ye, xs), -1)
+    np.add.at(diff, (ye, xe), 1)
+    mask = (diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0).astype(np.uint8)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    return [
+        (
+            x0 + x * cell,
+            y0 + y * cell,
+            min(x1, x0 + (x + width) * cell),
+            min(y1, y0 + (y + height) * cell),
+        )
+        for x, y, width, height, _ in stats[1:]
+    ]
+
+
+def search_window(last_loc, search_window_size, shape):
+    x_center, y_center = last_loc
+    x_start = max(0, x_center - search_window_size // 2)
+    y_start = max(0, y_center - search_window_size // 2)
+    x_end = min(shape[1], x_center + search_window_size // 2)
+    y_end = min(shape[0], y_center + search_window_size // 2)
+    return x_start, y_start, x_end, y_end
+
+
+class MotionGate:
+    # 和上一次完整匹配时相比, 光标所在的区域里没有像素变化, 就沿用上一次
+    # 的结果。没有找到光标时比较缩小后的整帧。每 keyframe_interval 帧至少
+    # 完整匹配一次, 防止误差累积。
+    def __init__(self, threshold=8, min_changed=4, keyframe_interval=30, scale=4):
+        self.threshold = threshold
+        self.min_changed = min_changed
+        self.keyframe_interval = keyframe_interval
+        self.scale = scale
+        self.reference = None  # (区域, 区域内的灰度图)
+        self.skipped = 0
+
+    def region(self, gray, window):
+        if window is None:
+            return cv2.resize(
+                gray,
+                None,
+                fx=1 / self.scale,
+                fy=1 / self.scale,
+                interpolation=cv2.INTER_AREA,
+            )
+        x_start, y_start, x_end, y_end = window
+        return gray[y_start:y_end, x_start:x_end]
+
+    def unchanged(self, gray):
+        if self.reference is None or self.skipped >= self.keyframe_interval:
+            return False
+        window, reference = self.reference
+        diff = cv2.absdiff(self.region(gray, window), reference)
+        if cv2.countNonZero((diff > self.threshold).view(np.uint8)) >= self.min_changed:
+            return False
+        self.skipped += 1
+        return True
+
+    def update(self, gray, window):
+        self.reference = (window, self.region(gray, window).copy())
+        self.skipped = 0
+
+
+class CursorTracker:
+    # 匀速运动模型: 按上一次的速度预测光标中心, 搜索窗口随预测的位移和
+    # 预测误差放大或缩小, 最小也要放得下模板。预测误差取衰减的峰值, 甩动
+    # 开始后窗口立即变大, 停下后逐渐缩小。adaptive=False 时是以上一次位置
+    # 为中心、大小固定的窗口。
+    def __init__(
+        self,
+        search_window_size,
+        adaptive=True,
+        min_window=128,
+        max_window=480,
+        gain=0.6,
+        error_decay=0.8,
+    ):
+        self.search_window_size = search_window_size
+        self.adaptive = adaptive
+        self.min_window = min_window
+        self.max_window = max_window
+        self.gain = gain
+        self.error_decay = error_decay
+        self.position = None
+        self.velocity = (0.0, 0.0)  # 像素/帧
+        self.error = 0.0  # 每帧的预测误差
+        self.frame = None
+        self.window_size = search_window_size
+
+    def predict(self, frame_index):
+        # 返回 (预测中心, 窗口大小), 还没有位置时中心为 None
+        if self.position is None or not self.adaptive:
+            return self.position, self.search_window_size
+        dt = frame_index - self.frame
+        x = self.position[0] + self.velocity[0] * dt
+        y = self.position[1] + self.velocity[1] * dt
+        uncertainty = (0.5 * np.hypot(*self.velocity) + 2 * self.error) * dt
+        self.window_size = int(
+            np.clip(self.min_window + 2 * uncertainty, self.min_window, self.max_window)
+        )
+        return (int(round(x)), int(round(y))), self.window_size
+
+    def update(self, frame_index, center):
+        if self.position is not None and self.adaptive:
+            dt = frame_index - self.frame
+            error = np.hypot(
+                center[0] - self.position[0] - self.velocity[0] * dt,
+                center[1] - self.position[1] - self.velocity[1] * dt,
+            )
+            if error > self.window_size / 2:
+                # 在窗口外 (全图搜索) 重新找到的, 这次位移不是速度
+                self.velocity = (0.0, 0.0)
+            else:
+                self.error = max(error / dt, self.error_decay * self.error)
+                self.velocity = tuple(
+                    (1 - self.gain) * v + self.gain * (c - p) / dt
+                    for v, c, p in zip(self.velocity, center, self.position)
+                )
+        self.position = center
+        self.frame = frame_index
+
+
+def match_area(
+    cache,
+    area,
+    templates,
+    negative_templates,
+    threshold_min,
+    threshold_max,
+    overlap_threshold,
+    matcher="exhaustive",
+    nms_threshold=None,
+):
+    # 在 area = (x_start, y_start, x_end, y_end) 内匹配一次, area 为 None 时搜全图
+    if area is None:
+        area = (0, 0, cache.gray.shape[1], cache.gray.shape[0])
+    x_start, y_start, x_end, y_end = area
+    search_offset = (x_start, y_start)
+    match = MATCHERS[matcher]
+    # 梯度域的匹配器在梯度幅值上匹配, 负模板也一样
+    domain = getattr(match, "domain", "gray")
+    if domain == "gradient":
+        search_area = cache.gradient(x_start, y_start, x_end, y_end)
+        negative_inputs = match.negative_gradients(negative_templates)
+    else:
+        search_area = cache.gray[y_start:y_end, x_start:x_end]
+        negative_inputs = negative_templates
+
+    tiles = match(search_area, templates)
+
+    # 按模板顺序逐块提取候选, 块内按行优先, 与逐像素生成元组时的顺序一致。
+    # 某一块里出现高置信度匹配就直接返回, 后面的模板不再匹配。
+    chunks = []
+    for index, res, (tile_x, tile_y) in tiles:
+        ys, xs = np.nonzero(res >= threshold_min)
+        if not len(xs):
+            continue
+        vals = res[ys, xs]
+        xs = xs + tile_x + search_offset[0]
+        ys = ys + tile_y + search_offset[1]
+        template, template_name = templates[index]
+        strong = np.flatnonzero(vals >= threshold_max)
+        if len(strong):
+            i = strong[0]
+            # Return early if a high-confidence match is found
+            return ((xs[i], ys[i]), template.shape[:2], template_name, vals[i])
+        chunks.append((index, xs, ys, vals))
+
+    if not chunks:
+        candidates = np.empty((0, 4), np.int64)
+        vals = np.empty(0, np.float32)
+        indices = np.empty(0, np.int64)
+    else:
+        candidates = np.concatenate(
+            [
+                np.column_stack(
+                    [
+                        xs,
+                        ys,
+                        np.full(len(xs), templates[index][0].shape[1]),
+                        np.full(len(xs), templates[index][0].shape[0]),
+                    ]
+                )
+                for index, xs, ys, _ in chunks
+            ]
+        )
+        vals = np.concatenate([chunk[3] for chunk in chunks])
+        indices = np.concatenate([np.full(len(chunk[1]), chunk[0]) for chunk in chunks])
+
+    if nms_threshold is not None and len(candidates):
+        keep = nms(candidates, vals, nms_threshold)
+        candidates, vals, indices = candidates[keep], vals[keep], indices[keep]
+
+    # Negative template matching and filtering, only around the candidates
+    if len(candidates):
+        negative_boxes = []
+        for index, negative_template in enumerate(negative_templates):
+            h, w = negative_template.shape[:2]
+            bounds = (
+                search_offset[0],
+                search_offset[1],
+                search_offset[0] + search_area.shape[1] - w + 1,
+                search_offset[1] + search_area.shape[0] - h + 1,
+            )
+            for x0, y0, x1, y1 in negative_windows(candidates, (h, w), bounds):
+                negative_res = cache.negative_response(
+                    index, negative_inputs[index], x0, y0, x1, y1, domain
+                )
+                neg_ys, neg_xs = np.nonzero(negative_res >= threshold_min)
+                negative_boxes.append(
+                    np.column_stack(
+                        [
+                            neg_xs + x0,
+                            neg_ys + y0,
+                            np.full(len(neg_xs), w),
+                            np.full(len(neg_xs), h),
+                        ]
+                    )
+                )
+        if negative_boxes:
+            negative_boxes = np.concatenate(negative_boxes)
+            keep = max_overlap(candidates, negative_boxes) < overlap_threshold
+            candidates, vals, indices = candidates[keep], vals[keep], indices[keep]
+
+    # Select the remaining area with the highest match confidence
+    if len(candidates):
+        # argmax 取第一个最大值, 与 max() 的结果相同
+        i = np.argmax(vals)
+        template, template_name = templates[indices[i]]
+        x, y = candidates[i, :2]
+        return ((x, y), template.shape[:2], template_name, vals[i])
+    return None
+
+
+class Escalation:
+    # ROI 里没找到光标时逐级扩大搜索: 先是 window_scales 倍大小的窗口, 再用
+    # global_matcher 搜全图 (默认与 ROI 相同的匹配方式; "pyramid" 更快, 但
+    # 在有相似干扰物的画面上会漏掉光标)。找到过光标之后, 连续 max_misses 帧
+    # 都没找到 (比如打字时光标被隐藏) 才退避, 只每隔 rescan_interval 帧升级
+    # 一次, 其余帧只搜 ROI; 第一次找到之前每帧都搜全图。给出帧序号时按帧序号决定
+    # 哪些帧升级, 并行处理的各段与顺序处理在同一帧上升级。
+    # budget 是可选的每帧时间预算 (秒): 搜索超过它就不再升级, 下一帧从没搜到
+    # 的那一级接着搜。它按墙上时间判断, 结果会随机器负载变化, 顺序和并行处理
+    # 的结果也不再一致, 所以默认不开。
+    # 参数为 None 的一项不限制; Escalation.legacy() 是原来的 "ROI 没找到就用
+    # 同一匹配方式搜全图"。
+    def __init__(
+        self,
+        window_scales=(2, 4),
+        global_matcher=None,
+        budget=None,
+        max_misses=5,
+        rescan_interval=10,
+    ):
+        self.window_scales = window_scales
+        self.global_matcher = global_matcher
+        self.budget = budget
+        self.max_misses = max_misses
+        self.rescan_interval = rescan_interval
+        self.misses = 0
+        self.found = False  # 是否找到过光标
+        self.resume = 0  # 上一帧因超出预算没有搜到的级别
+
+    @classmethod
+    def legacy(cls):
+        return cls(window_scales=(), global_matcher=None, budget=None, max_misses=None)
+
+    def levels(self, last_loc, search_window_size, shape, matcher):
+        # ROI 之后依次搜索的 (级别名, 搜索范围, 匹配方式), 搜索范围为 None 表示全图
+        levels = []
+        if last_loc:
+            for scale in self.window_scales:
+                area = search_window(last_loc, search_window_size * scale, shape)
+                if area == (0, 0, shape[1], shape[0]):
+                    break
+                levels.append((f"window_x{scale}", area, matcher))
+        levels.append(("global", None, self.global_matcher or matcher))
+        return levels
+
+    def hit(self, match, level, stats):
+        stats[f"hit_{level}"] = stats.get(f"hit_{level}", 0) + 1
+        self.misses = 0
+        self.found = True
+        self.resume = 0
+        return match
+
+    def miss(self, stats):
+        stats["miss"] = stats.get("miss", 0) + 1
+        self.misses += 1
+        return None
+
+    def backing_off(self, frame_index=None):
+        if self.max_misses is None or not self.found or self.misses < self.max_misses:
+            return False
+        if frame_index is None:
+            frame_index = self.misses - self.max_misses
+        return frame_index % self.rescan_interval != 0
+
+    def over_budget(self, start):
+        return self.budget is not None and time.perf_counter() - start > self.budget
+
+
 def match_mouse(
     frame,
     templates,
@@ -57,163 +941,397 @@ def match_mouse(
     threshold_min,
     threshold_max,
     overlap_threshold,
-    r=0,
+    matcher="exhaustive",
+    nms_threshold=None,
+    cache=None,
+    stats=None,
+    escalation=None,
+    frame_index=None,
 ):
-    frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    candidates = []
+    if cache is None:
+        cache = FrameCache(frame)
+    if escalation is None:
+        escalation = Escalation.legacy()
+    stats = stats if stats is not None else {}
+    # roi: 在窗口内搜索; full: 没有上一次位置; fallback: 窗口内没找到再升级
+    key = "roi" if last_loc else "full"
+    stats[key] = stats.get(key, 0) + 1
 
-    # Determine the search area based on the last location
+    search = functools.partial(
+        match_area,
+        cache,
+        templates=templates,
+        negative_templates=negative_templates,
+        threshold_min=threshold_min,
+        threshold_max=threshold_max,
+        overlap_threshold=overlap_threshold,
+        nms_threshold=nms_threshold,
+    )
+    start = time.perf_counter()
     if last_loc:
-        x_center, y_center = last_loc
-        x_start = max(0, x_center - search_window_size // 2)
-        y_start = max(0, y_center - search_window_size // 2)
-        x_end = min(frame.shape[1], x_center + search_window_size // 2)
-        y_end = min(frame.shape[0], y_center + search_window_size // 2)
-        search_area = frame_gray[y_start:y_end, x_start:x_end]
-        search_offset = (x_start, y_start)
-    else:
-        search_area = frame_gray
-        search_offset = (0, 0)
+        match = search(
+            search_window(last_loc, search_window_size, frame.shape), matcher=matcher
+        )
+        if match:
+            return escalation.hit(match, "roi", stats)
 
-    for template, template_name in templates:
-        res = cv2.matchTemplate(search_area, template, cv2.TM_CCOEFF_NORMED)
-        loc = np.where(res >= threshold_min)
+    if escalation.backing_off(frame_index):
+        stats["backoff"] = stats.get("backoff", 0) + 1
+        return escalation.miss(stats)
+    if last_loc:
+        stats["fallback"] = stats.get("fallback", 0) + 1
+    levels = escalation.levels(last_loc, search_window_size, frame.shape, matcher)
+    # 上一帧超出预算时从还没搜过的那一级接着搜, 每帧至少搜一级
+    first = min(escalation.resume, len(levels) - 1)
+    for level in range(first, len(levels)):
+        if level > first and escalation.over_budget(start):
+            escalation.resume = level
+            stats["over_budget"] = stats.get("over_budget", 0) + 1
+            return escalation.miss(stats)
+        name, area, level_matcher = levels[level]
+        match = search(area, matcher=level_matcher)
+        if match:
+            return escalation.hit(match, name, stats)
+    escalation.resume = 0
+    return escalation.miss(stats)
 
-        for pt in zip(*loc[::-1]):  # Convert points to full image coordinates
-            full_img_pt = (pt[0] + search_offset[0], pt[1] + search_offset[1])
-            candidates.append(
-                (full_img_pt, template.shape[:2], template_name, res[pt[1]][pt[0]])
-            )
 
-    # Check for high-confidence matches
-    for candidate in candidates:
-        if candidate[3] >= threshold_max:
-            return candidate  # Return early if a high-confidence match is found
-
-    # Negative template matching and filtering
-    negative_matches = []
-    for negative_template in negative_templates:
-        negative_res = cv2.matchTemplate(
-            search_area, negative_template, cv2.TM_CCOEFF_NORMED
-        )
-        negative_loc = np.where(negative_res >= threshold_min)
-        for neg_pt in zip(*negative_loc[::-1]):
-            full_img_neg_pt = (
-                neg_pt[0] + search_offset[0],
-                neg_pt[1] + search_offset[1],
+class LogGuide:
+    # 用录制时的动作日志预测每一帧光标的位置。只用带 time 和 position 的
+    # 事件, 也就是 mouse_move 和 click; scroll/drag 只有 start_time/end_time,
+    # 不参与预测 (滚动时光标基本不动, 前一条记录的位置已经够用)。
+    # 日志是归一化坐标和相对视频开始的秒数; 帧的时间来自
+    # frames_*.json 帧时间映射, 没有时按帧率换算。日志记录的是光标热点,
+    # 匹配框的中心与它有一个偏移, 由每次匹配的结果逐步修正。
+    def __init__(
+        self,
+        events,
+        fps,
+        frame_map=None,
+        window_size=96,
+        max_gap=0.25,
+        offset_gain=0.3,
+    ):
+        events = sorted(
+            (e for e in events if "position" in e and "time" in e),
+            key=lambda e: e["time"],
+        )
+        self.times = np.array([e["time"] for e in events])
+        self.xs = np.array([e["position"]["x"] for e in events])
+        self.ys = np.array([e["position"]["y"] for e in events])
+        self.fps = fps
+        self.frame_map = frame_map
+        self.window_size = window_size
+        self.max_gap = max_gap
+        self.offset_gain = offset_gain
+        self.offset = (0.0, 0.0)
+
+    @classmethod
+    def from_files(cls, log_file, fps, **kwargs):
+        # frames_<时间>.json 与 log_<时间>.json(l) 在同一个目录
+        frame_map_file = os.path.join(
+            os.path.dirname(log_file),
+            os.path.basename(log_file).replace("log_", "frames_").rsplit(".", 1)[0]
+            + ".json",
+        )
+        frame_map = None
+        if os.path.exists(frame_map_file):
+            frame_map = FrameMap.load(frame_map_file)
+        return cls(iter_log(log_file), fps, frame_map, **kwargs)
+
+    def frame_time(self, frame_index):
+        if self.frame_map is not None and self.frame_map.frame:
+            return self.frame_map.time_of_index(frame_index)
+        return frame_index / self.fps
+
+    def position(self, t):
+        # 相邻两条记录间隔不超过 max_gap 时线性插值; 间隔更长说明光标停过,
+        # 保持前一条的位置
+        i = np.searchsorted(self.times, t, side="right") - 1
+        if i < 0 or not len(self.times):
+            return None
+        if (
+            i + 1 < len(self.times)
+            and self.times[i + 1] - self.times[i] <= self.max_gap
+        ):
+            ratio = (t - self.times[i]) / (self.times[i + 1] - self.times[i])
+            return (
+                self.xs[i] + (self.xs[i + 1] - self.xs[i]) * ratio,
+                self.ys[i] + (self.ys[i + 1] - self.ys[i]) * ratio,
             )
-            negative_matches.append((full_img_neg_pt, negative_template.shape[:2]))
+        return self.xs[i], self.ys[i]
+
+    def expected(self, frame_index, width, height):
+        # 这一帧匹配框中心的预期位置 (像素), 日志还没开始时为 None
+        position = self.position(self.frame_time(frame_index))
+        if position is None:
+            return None
+        return (
+            int(round(position[0] * width + self.offset[0])),
+            int(round(position[1] * height + self.offset[1])),
+        )
 
-    filtered_candidates = []
-    for candidate in candidates:
-        pt, size, template_name, val = candidate
-        max_overlap = 0
-        for neg_pt, neg_size in negative_matches:
-            rect1 = (pt[0], pt[1], size[1], size[0])
-            rect2 = (neg_pt[0], neg_pt[1], neg_size[1], neg_size[0])
-            overlap = calculate_overlap(rect1, rect2)
-            max_overlap = max(max_overlap, overlap)
+    def observe(self, expected, center):
+        # 离预期太远的匹配多半是全图搜索找到的别处, 不用来修正偏移
+        dx, dy = center[0] - expected[0], center[1] - expected[1]
+        if max(abs(dx), abs(dy)) > self.window_size:
+            return
+        self.offset = (
+            self.offset[0] + self.offset_gain * dx,
+            self.offset[1] + self.offset_gain * dy,
+        )
 
-        if max_overlap < overlap_threshold:
-            filtered_candidates.append(candidate)
 
-    # Select the remaining area with the highest match confidence
-    if filtered_candidates:
-        best_match = max(filtered_candidates, key=lambda x: x[3])
-        return best_match
+def print_search_stats(stats):
+    roi = stats.get("roi", 0)
+    fallback = stats.get("fallback", 0)
+    rate = fallback / roi if roi else 0
+    print(
+        f"ROI searches: {roi}, full-frame fallbacks: {fallback} ({rate:.1%}), "
+        f"searches without a location: {stats.get('full', 0)}"
+    )
+    if "guided" in stats:
+        print(f"Log-guided frames: {stats['guided']}")
+    hits = {
+        key[len("hit_") :]: value
+        for key, value in stats.items()
+        if key.startswith("hit_")
+    }
+    if hits:
+        print(
+            "Hits per level: "
+            + ", ".join(f"{name} {count}" for name, count in sorted(hits.items()))
+            + f", not found {stats.get('miss', 0)}"
+        )
+    if stats.get("backoff") or stats.get("over_budget"):
+        print(
+            f"Escalation skipped: {stats.get('backoff', 0)} backing off, "
+            f"{stats.get('over_budget', 0)} over budget"
+        )
 
-    if r == 1:
+
+def keyframe_indices(video_path):
+    # 用 ffprobe 列出关键帧的帧序号 (按包的顺序, 录制时没有 B 帧),
+    # 没有 ffprobe 时返回 None
+    try:
+        output = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "packet=flags",
+                "-of",
+                "csv=p=0",
+                video_path,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
         return None
+    return [i for i, flags in enumerate(output.split()) if "K" in flags]
 
-    return match_mouse(
-        frame,
-        templates,
-        negative_templates,
-        None,
-        None,
-        threshold_min,
-        threshold_max,
-        overlap_threshold,
-        1,
-    )
 
+def plan_chunks(frame_count, chunks, overlap, keyframes=None):
+    # 把视频按帧数均分成 chunks 段, 有关键帧列表时每个边界挪到最近的关键帧,
+    # 这样每段都从关键帧开始解码。相邻边界至少相隔 2 * overlap 帧。
+    boundaries = [0]
+    for i in range(1, chunks):
+        target = frame_count * i // chunks
+        if keyframes:
+            target = min(keyframes, key=lambda k: abs(k - target))
+        if target - boundaries[-1] >= 2 * overlap and frame_count - target >= overlap:
+            boundaries.append(target)
+    boundaries.append(frame_count)
+    return boundaries
 
-def process_video(
+
+def track_video(
     video_path,
-    template_dir,
-    negative_template_dir,
+    templates,
+    negative_templates,
     output_dir,
     threshold_min,
     threshold_max,
     overlap_threshold,
     search_window_size,
+    matcher="exhaustive",
+    motion_threshold=8,
+    keyframe_interval=30,
+    adaptive_window=True,
+    log_file=None,
+    start=0,
+    stop=None,
+    emit_from=0,
+    output="sampled",
+    sample_every=30,
+    decode_backend=None,
+    bank=None,
+    reload_interval=300,
+    escalation=None,
+    writer=None,
 ):
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    templates, negative_templates = load_templates(template_dir, negative_template_dir)
-    cap = cv2.VideoCapture(video_path)
-    frame_count = 0
-    results = []
-    last_loc = None  # Initialize last known location
-
-    while True:
-        ret, frame = cap.read()
-
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    # 跟踪 [start, stop) 范围内的帧, 只输出 emit_from 及以后的结果和图片,
+    # 之前的帧只用来找到光标、让跟踪状态稳定下来。解码在后台线程里进行,
+    # 匹配直接用解码器给出的灰度图。输出图片或视频也只用灰度图, sink 只把
+    # 要保存的帧在后台线程里转成 BGR 再画框, 解码一直是灰度的。
+    reader = FrameReader(video_path, start, stop, backend=decode_backend)
+    # 并行处理时每段写自己的视频文件, 按段的起始帧命名
+    sink = make_sink(
+        output,
+        output_dir,
+        reader.fps,
+        sample_every,
+        suffix=f"_{start:06d}" if start or stop is not None else "",
+    )
+    # 给出录制日志时, 先在日志预测的位置附近的小窗口里找
+    guide = LogGuide.from_files(log_file, reader.fps) if log_file is not None else None
+    # 给出 writer 时结果直接流式写出, 不在内存里累积
+    results = writer if writer is not None else []
+    tracker = CursorTracker(search_window_size, adaptive=adaptive_window)
+    last_match = None
+    # motion_threshold=None 时每一帧都完整匹配
+    gate = (
+        MotionGate(motion_threshold, keyframe_interval=keyframe_interval)
+        if motion_threshold is not None
+        else None
+    )
+    stats = {"frames": 0, "carried": 0}
+    # 没找到光标时的搜索策略, 并行时每段各有一份状态
+    escalation = escalation if escalation is not None else Escalation()
 
-        if not ret:
-            break
+    for frame_count, gray, _ in reader:
+        emit = frame_count >= emit_from
+        # 每 reload_interval 帧检查一次模板文件, 有变化就换用新模板
+        if (
+            bank is not None
+            and frame_count % reload_interval == 0
+            and frame_count != start
+            and bank.refresh()
+        ):
+            templates, negative_templates = bank.templates, bank.negative_templates
 
-        match = match_mouse(
-            frame,
-            templates,
-            negative_templates,
-            last_loc,
-            search_window_size,
-            threshold_min,
-            threshold_max,
-            overlap_threshold,
-        )
+        cache = FrameCache(gray)
+        carried = gate is not None and gate.unchanged(cache.gray)
+        if carried:
+            match = last_match
+            if emit:
+                stats["carried"] += 1
+        else:
+            center, window_size = tracker.predict(frame_count)
+            expected = None
+            if guide is not None:
+                expected = guide.expected(frame_count, gray.shape[1], gray.shape[0])
+            if expected is not None:
+                center, window_size = expected, guide.window_size
+                if emit:
+                    stats["guided"] = stats.get("guided", 0) + 1
+            match = match_mouse(
+                gray,
+                templates,
+                negative_templates,
+                center,
+                window_size,
+                threshold_min,
+                threshold_max,
+                overlap_threshold,
+                matcher=matcher,
+                cache=cache,
+                stats=stats if emit else None,
+                escalation=escalation,
+                frame_index=frame_count,
+            )
         if match:
             loc, size, template_name, confidence = match
             x, y = loc
-            w, h = size
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            results.append(
-                {
-                    "Frame": frame_count,
-                    "X": x,
-                    "Y": y,
-                    "Width": w,
-                    "Height": h,
-                    "Template": template_name,
-                    "Confidence": confidence,
-                }
+            h, w = size
+            if emit:
+                results.append(
+                    {
+                        "Frame": frame_count,
+                        "X": x,
+                        "Y": y,
+                        "Width": w,
+                        "Height": h,
+                        "Template": template_name,
+                        "Confidence": confidence,
+                        "Carried": carried,
+                    }
+                )
+            # 沿用上一帧结果的帧不是新的观测, 不更新速度和日志偏移
+            if not carried:
+                tracker.update(frame_count, (x + w // 2, y + h // 2))
+                if expected is not None:
+                    guide.observe(expected, (x + w // 2, y + h // 2))
+        last_match = match
+        if gate is not None and not carried:
+            # 下一帧和这一帧的光标区域 (加一圈边) 比较
+            gate.update(
+                cache.gray,
+                (
+                    search_window((x + w // 2, y + h // 2), max(w, h) + 16, gray.shape)
+                    if match
+                    else None
+                ),
             )
-            last_loc = (x + w // 2, y + h // 2)  # Update last known location
 
-        print(f"Frame {frame_count}: {match}")
-        frame_file = f"frame_{frame_count}.png"
-        cv2.imwrite(os.path.join(output_dir, frame_file), frame)
-        frame_count += 1
+        if emit:
+            stats["frames"] += 1
+            print(f"Frame {frame_count}: {match}")
+            # 画框和写盘都在 sink 的后台线程里做
+            sink.submit(frame_count, gray, (x, y, w, h) if match else None)
 
+    reader.close()
+    sink.close()
+    return results, stats
+
+
+def track_parallel(video_path, workers, overlap, *args, writer=None, **kwargs):
+    # 把视频切成若干段, 每段在单独的进程里解码和跟踪。第 i 段多跟踪下一段的
+    # 前 overlap 帧并输出它们的结果; 下一段的前 overlap 帧只用来重新找到
+    # 光标, 不输出。因此只有在下一段 overlap 帧内跟踪状态 (光标位置、运动
+    # 检测、日志偏移) 还没稳定下来时, 结果才会与顺序处理不同。
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     cap.release()
-    df = pd.DataFrame(results)
-    df.to_csv(os.path.join(output_dir, "mouse_positions.csv"), index=False)
-    print("Processing complete. Results saved to", output_dir)
+    # 段数多于进程数, 各进程的负载更均匀
+    boundaries = plan_chunks(
+        frame_count, workers * 4, overlap, keyframe_indices(video_path)
+    )
+
+    # 各段的结果按顺序交给 writer, 内存里最多是已完成但还没轮到的段
+    results = writer if writer is not None else []
+    stats = {}
+    with ProcessPoolExecutor(workers) as pool:
+        futures = []
+        for i, (start, stop) in enumerate(zip(boundaries, boundaries[1:])):
+            last = i == len(boundaries) - 2
+            futures.append(
+                pool.submit(
+                    track_video,
+                    video_path,
+                    *args,
+                    **kwargs,
+                    start=start,
+                    # 最后一段读到视频结束, 不依赖可能不准的总帧数
+                    stop=None if last else stop + overlap,
+                    emit_from=start + overlap if i else 0,
+                )
+            )
+        for i, future in enumerate(futures):
+            chunk_results, chunk_stats = future.result()
+            futures[i] = None
+            results.extend(chunk_results)
+            for key, value in chunk_stats.items():
+                stats[key] = stats.get(key, 0) + value
+    return results, stats
 
 
-# Example usage
-video_path = "videos/screen_2024-04-18_16-45-08.mp4"
-template_dir = "cursors/positive"
-negative_template_dir = "cursors/negative"
-output_dir = "output"
-threshold_min = 0.68
-threshold_max = 0.75
-overlap_threshold = 0.6
-search_window_size = 200  # Adjust this value based on expected movement between frames
-process_video(
+def process_video(
     video_path,
     template_dir,
     negative_template_dir,
@@ -222,4 +1340,76 @@ process_video(
     threshold_max,
     overlap_threshold,
     search_window_size,
-)
+    matcher="exhaustive",
+    motion_threshold=8,
+    keyframe_interval=30,
+    adaptive_window=True,
+    log_file=None,
+    workers=1,
+    overlap=30,
+    output="sampled",
+    sample_every=30,
+    decode_backend=None,
+    escalation=None,
+    results_file="mouse_positions.csv",
+):
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    bank = TemplateBank(template_dir, negative_template_dir)
+    args = (
+        bank.templates,
+        bank.negative_templates,
+        output_dir,
+        threshold_min,
+        threshold_max,
+        overlap_threshold,
+        search_window_size,
+    )
+    kwargs = {
+        "matcher": matcher,
+        "motion_threshold": motion_threshold,
+        "keyframe_interval": keyframe_interval,
+        "adaptive_window": adaptive_window,
+        "log_file": log_file,
+        "output": output,
+        "sample_every": sample_every,
+        "decode_backend": decode_backend,
+        "bank": bank,
+        "escalation": escalation,
+    }
+    # results_file 以 .parquet 结尾时写成 Parquet 目录 (需要 pyarrow)
+    with ResultWriter(os.path.join(output_dir, results_file), RESULT_COLUMNS) as writer:
+        if workers > 1:
+            _, stats = track_parallel(
+                video_path, workers, overlap, *args, writer=writer, **kwargs
+            )
+        else:
+            _, stats = track_video(video_path, *args, writer=writer, **kwargs)
+
+    print(f"Carried forward {stats['carried']} of {stats['frames']} frames")
+    print_search_stats(stats)
+    print("Processing complete. Results saved to", output_dir)
+
+
+if __name__ == "__main__":
+    # Example usage
+    video_path = "videos/screen_2024-04-18_16-45-08.mp4"
+    template_dir = "cursors/positive"
+    negative_template_dir = "cursors/negative"
+    output_dir = "output"
+    threshold_min = 0.68
+    threshold_max = 0.75
+    overlap_threshold = 0.6
+    # Adjust this value based on expected movement between frames
+    search_window_size = 200
+    process_video(
+        video_path,
+        template_dir,
+        negative_template_dir,
+        output_dir,
+        threshold_min,
+        threshold_max,
+        overlap_threshold,
+        search_window_size,
+    )
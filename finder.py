@@ -6,7 +6,7 @@ from torchvision import models, transforms
 import numpy as np
 import cv2
 import os
-import json
+from actionlog import is_log_file, load_log
 
 class MouseMoveDataset(Dataset):
     def __init__(self, video_folder, log_folder, transform=None):
@@ -15,15 +15,14 @@ class MouseMoveDataset(Dataset):
         self.transform = transform
 
         self.video_files = [f for f in os.listdir(video_folder) if f.endswith(".mp4")]
-        self.log_files = [f for f in os.listdir(log_folder) if f.endswith(".json")]
+        self.log_files = [f for f in os.listdir(log_folder) if is_log_file(f)]
 
         self.mouse_move_events = []
         for log_file in self.log_files:
-            with open(os.path.join(self.log_folder, log_file), "r") as f:
-                log_data = json.load(f)
+            log_data = load_log(os.path.join(self.log_folder, log_file))
             self.mouse_move_events.extend(
                 [
-                    (log_file[:-5], event)
+                    (log_file.rsplit(".", 1)[0], event)
                     for event in log_data
                     if event["type"] == "mouse_move"
                 ]
@@ -0,0 +1,128 @@
+import json
+import time
+from array import array
+from bisect import bisect_right
+from actionlog import NS_PER_SECOND
+
+
+class FrameMap:
+    # 由 ffmpeg -progress 输出构建的 帧序号 -> 时间 映射。每个进度块记录一次
+    # (已输出帧数, 收到时的 perf_counter_ns, 重复帧累计, 丢弃帧累计), 默认每
+    # 0.5 秒一条, 所以一段长录制也只有几千个采样点。
+    #
+    # frame 是 "到这个时间为止已经输出的帧数", 不是帧序号: frame_at(t) 和
+    # time_of(n) 都按帧数计。视频里从 0 开始的帧序号用 index_at(t) 和
+    # time_of_index(i), 时间 t 时画面上的是第 frame_at(t) - 1 帧。
+    def __init__(self):
+        self.frame = array("q")
+        self.time = array("q")
+        self.dup = array("q")
+        self.drop = array("q")
+        self.out_time_us = 0
+
+    def add(self, frame, wall_ns, dup, drop):
+        if self.frame and frame <= self.frame[-1]:
+            return
+        self.frame.append(frame)
+        self.time.append(wall_ns)
+        self.dup.append(dup)
+        self.drop.append(drop)
+
+    def frame_at(self, t):
+        # 按时间二分查找, 在相邻两个采样点之间线性插值
+        i = bisect_right(self.time, t)
+        if i == 0:
+            return 0
+        if i == len(self.time):
+            return self.frame[-1]
+        t0, t1 = self.time[i - 1], self.time[i]
+        f0, f1 = self.frame[i - 1], self.frame[i]
+        return int(round(f0 + (f1 - f0) * (t - t0) / (t1 - t0)))
+
+    def index_at(self, t):
+        # 时间 t 时最后一个已输出帧的序号 (从 0 开始)
+        return max(0, self.frame_at(t) - 1)
+
+    def time_of_index(self, index):
+        # 第 index 帧 (从 0 开始) 输出的时间, 即输出帧数达到 index + 1 的时间
+        return self.time_of(index + 1)
+
+    def time_of(self, frame):
+        i = bisect_right(self.frame, frame)
+        if i == 0:
+            return self.time[0]
+        if i == len(self.frame):
+            return self.time[-1]
+        f0, f1 = self.frame[i - 1], self.frame[i]
+        t0, t1 = self.time[i - 1], self.time[i]
+        return t0 + (t1 - t0) * (frame - f0) / (f1 - f0)
+
+    def segment(self, start_ns, end_ns, first_frame):
+        # 分段录制时一个分段的映射, 帧数从分段的第一帧 (整段视频的第
+        # first_frame 帧) 算起。分段两侧各多留一个采样点, 边界附近仍能插值。
+        lo = max(0, bisect_right(self.time, start_ns) - 1)
+        hi = min(len(self.time), bisect_right(self.time, end_ns) + 1)
+        part = FrameMap()
+        for i in range(lo, hi):
+            part.frame.append(self.frame[i] - first_frame)
+            part.time.append(self.time[i])
+            part.dup.append(self.dup[i])
+            part.drop.append(self.drop[i])
+        return part
+
+    def save(self, filename, anchor_ns):
+        data = {
+            "frame": self.frame.tolist(),
+            "time": [(t - anchor_ns) / NS_PER_SECOND for t in self.time],
+            "dup": self.dup.tolist(),
+            "drop": self.drop.tolist(),
+        }
+        with open(filename, "w") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "r") as f:
+            data = json.load(f)
+        frame_map = cls()
+        # 载入后时间单位是相对视频开始的秒数, 与日志中的时间一致
+        frame_map.frame = data["frame"]
+        frame_map.time = data["time"]
+        frame_map.dup = data["dup"]
+        frame_map.drop = data["drop"]
+        return frame_map
+
+
+def read_progress(stream, frame_map, on_first_frame=None):
+    # 读取 "-progress pipe:2 -nostats" 的 key=value 输出, 直到 ffmpeg 退出。
+    # 不是 key=value 的行是 ffmpeg 自己的报错, 原样打印。
+    block = {}
+    started = False
+    for raw in iter(stream.readline, b""):
+        line = raw.decode("utf-8", errors="replace").strip()
+        key, sep, value = line.partition("=")
+        if not sep or " " in key:
+            if line:
+                print(line)
+            continue
+        if key != "progress":
+            block[key] = value
+            continue
+
+        wall_ns = time.perf_counter_ns()
+        frame = int(block.get("frame", 0) or 0)
+        out_time_us = block.get("out_time_us", "N/A")
+        frame_map.out_time_us = int(out_time_us) if out_time_us.isdigit() else 0
+        if frame > 0:
+            frame_map.add(
+                frame,
+                wall_ns,
+                int(block.get("dup_frames", 0) or 0),
+                int(block.get("drop_frames", 0) or 0),
+            )
+            if not started:
+                started = True
+                if on_first_frame is not None:
+                    # 第一帧的时间 = 收到进度的时间 - 已经输出的视频时长
+                    on_first_frame(wall_ns - frame_map.out_time_us * 1000)
+        block = {}
@@ -0,0 +1,126 @@
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 只写 CSV 时不需要
+    pa = None
+
+# 模板名之类重复很多的字符串列, 内存里只存整数 id
+DICTIONARY = "dictionary"
+
+
+class ResultWriter:
+    # 逐行追加结果, 攒够 chunk_size 行就写出一块, 内存里只有当前这一块。
+    # columns 是 (列名, dtype) 列表, dtype 为 DICTIONARY 的列做字典编码。
+    #
+    # .csv 每块追加到文件末尾并 flush; .parquet 是一个目录, 每块写成一个
+    # 完整的 part-*.parquet 文件 (字典列用 Arrow 的 dictionary 类型)。处理
+    # 中途崩溃时最多丢失最后一块, 已写出的部分可以用 pandas 直接读。
+    def __init__(self, filename, columns, chunk_size=1000):
+        self.filename = filename
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.parquet = filename.endswith(".parquet")
+        if self.parquet and pa is None:
+            raise RuntimeError("pyarrow is required for Parquet output")
+        self.buffers = {
+            name: np.empty(chunk_size, np.int32 if dtype == DICTIONARY else dtype)
+            for name, dtype in columns
+        }
+        self.dictionaries = {name: {} for name, dtype in columns if dtype == DICTIONARY}
+        self.size = 0
+        self.count = 0
+        self.parts = 0
+        self.file = None
+        if self.parquet:
+            os.makedirs(filename, exist_ok=True)
+            for part in os.listdir(filename):
+                if part.startswith(("part-", "_part-")):
+                    os.remove(os.path.join(filename, part))
+        else:
+            self.file = open(filename, "w", newline="")
+            self.file.write(",".join(name for name, _ in columns) + "\n")
+            self.file.flush()
+
+    def append(self, row):
+        for name, _ in self.columns:
+            value = row[name]
+            if name in self.dictionaries:
+                value = self.dictionaries[name].setdefault(
+                    value, len(self.dictionaries[name])
+                )
+            self.buffers[name][self.size] = value
+        self.size += 1
+        self.count += 1
+        if self.size == self.chunk_size:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self.count
+
+    def flush(self):
+        if not self.size:
+            return
+        if self.parquet:
+            self._write_parquet()
+        else:
+            self._write_csv()
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _names(self, name):
+        # id -> 字符串, 按 id 排列
+        names = [None] * len(self.dictionaries[name])
+        for value, index in self.dictionaries[name].items():
+            names[index] = value
+        return names
+
+    def _write_csv(self):
+        # CSV 没有字典类型, 字典列写回原来的字符串, 与以前的文件格式相同
+        data = {}
+        for name, _ in self.columns:
+            values = self.buffers[name][: self.size]
+            if name in self.dictionaries:
+                values = np.array(self._names(name), object)[values]
+            data[name] = values
+        pd.DataFrame(data).to_csv(self.file, header=False, index=False)
+        self.file.flush()
+
+    def _write_parquet(self):
+        arrays = []
+        for name, _ in self.columns:
+            values = self.buffers[name][: self.size]
+            if name in self.dictionaries:
+                arrays.append(
+                    pa.DictionaryArray.from_arrays(
+                        pa.array(values), pa.array(self._names(name), pa.string())
+                    )
+                )
+            else:
+                arrays.append(pa.array(values))
+        table = pa.Table.from_arrays(arrays, names=[name for name, _ in self.columns])
+        # 先写临时文件再改名, 读的一方不会看到写了一半的 part (以 _ 开头的
+        # 文件读取时会被忽略)
+        part = f"part-{self.parts:05d}.parquet"
+        temp = os.path.join(self.filename, f"_{part}")
+        pq.write_table(table, temp)
+        os.replace(temp, os.path.join(self.filename, part))
+        self.parts += 1
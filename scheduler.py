@@ -0,0 +1,98 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from actionlog import NS_PER_SECOND
+
+
+class Scheduler:
+    # 单个线程管理所有超时回调。每个 key 只保留最新一次 schedule() 的截止时间,
+    # 重新调度只是一次 O(log n) 的堆插入, 旧的堆项在弹出时按序号丢弃。
+    def __init__(self):
+        self.heap = []
+        self.entries = {}  # key -> (seq, callback)
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def schedule(self, key, delay, callback):
+        deadline = time.perf_counter_ns() + int(delay * NS_PER_SECOND)
+        with self.condition:
+            seq = next(self.counter)
+            self.entries[key] = (seq, callback)
+            heapq.heappush(self.heap, (deadline, seq, key))
+            # 旧堆项太多时整理一次, 保证堆大小有上界
+            if len(self.heap) > 2 * len(self.entries) + 64:
+                self.heap = [
+                    item for item in self.heap if self._is_current(item[1], item[2])
+                ]
+                heapq.heapify(self.heap)
+            if self.heap[0][1] == seq:
+                self.condition.notify()
+
+    def cancel(self, key):
+        with self.condition:
+            self.entries.pop(key, None)
+
+    def pending(self):
+        with self.condition:
+            return len(self.entries)
+
+    def _is_current(self, seq, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] == seq
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, run_pending=False):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if run_pending:
+            # 停止时立即执行还没到期的回调 (比如键盘缓冲区和滚动)
+            with self.condition:
+                items = sorted(self.heap)
+                callbacks = [
+                    self.entries[key][1]
+                    for _, seq, key in items
+                    if self._is_current(seq, key)
+                ]
+                self.heap = []
+                self.entries = {}
+            for callback in callbacks:
+                callback()
+
+    def _run(self):
+        with self.condition:
+            while self.running:
+                while self.heap and not self._is_current(
+                    self.heap[0][1], self.heap[0][2]
+                ):
+                    heapq.heappop(self.heap)
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                deadline, seq, key = self.heap[0]
+                remaining = deadline - time.perf_counter_ns()
+                if remaining > 0:
+                    self.condition.wait(remaining / NS_PER_SECOND)
+                    continue
+                heapq.heappop(self.heap)
+                _, callback = self.entries.pop(key)
+                self.condition.release()
+                try:
+                    callback()
+                except Exception:
+                    traceback.print_exc()
+                finally:
+                    self.condition.acquire()
@@ -0,0 +1,194 @@
+import os
+import queue
+import threading
+import time
+import cv2
+
+SINK_MODES = ("none", "sampled", "video", "crops")
+
+_STOP = object()
+
+
+class FrameSink:
+    # 调试输出的基类。submit() 只把帧放进有界队列, 画框、编码和写盘都在后台
+    # 线程里做 (OpenCV 在这些调用中会释放 GIL)。队列满时丢弃这一帧并计数,
+    # 解码和匹配的循环不会等磁盘。写出错的帧也只计数, 工作线程继续取队列,
+    # close() 最多等 timeout 秒。annotate(frame, box) 负责在帧上画标记。
+    # 帧可以是灰度图, 只有真正要写出的帧才在工作线程里转成 BGR。
+    def __init__(self, workers=2, max_queue=64, annotate=None, timeout=30):
+        self.annotate = annotate or draw_box
+        self.queue = queue.Queue(max_queue)
+        self.timeout = timeout
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.error = None
+        self.lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def wants(self, frame_index, box):
+        return True
+
+    def submit(self, frame_index, frame, box=None):
+        # box 为 (x, y, w, h), 没有检测结果时为 None
+        if not self.wants(frame_index, box):
+            return
+        try:
+            self.queue.put_nowait((frame_index, frame, box))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        deadline = time.monotonic() + self.timeout
+        for _ in self.threads:
+            try:
+                self.queue.put(_STOP, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        name = type(self).__name__
+        if any(thread.is_alive() for thread in self.threads):
+            # 工作线程是 daemon, 不会阻止进程退出; 还在写的文件不去关闭
+            print(f"{name}: gave up waiting after {self.timeout}s")
+        else:
+            self._close()
+        if self.dropped:
+            print(f"{name}: dropped {self.dropped} frames (queue full)")
+        if self.failed:
+            print(f"{name}: failed to write {self.failed} frames ({self.error!r})")
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                    if self.error is None:
+                        self.error = e
+                continue
+            with self.lock:
+                self.written += 1
+
+    def _write(self, frame_index, frame, box):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+def to_bgr(frame):
+    if frame.ndim == 2:
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    return frame
+
+
+def draw_box(frame, box):
+    if box is not None:
+        x, y, w, h = box
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    return frame
+
+
+class NullSink(FrameSink):
+    def __init__(self):
+        super().__init__(workers=0)
+
+    def wants(self, frame_index, box):
+        return False
+
+
+class SampledSink(FrameSink):
+    # 每 every 帧保存一张标注后的图片, every=1 就是原来每帧一张
+    def __init__(self, output_dir, every=30, pattern="frame_{}.png", **kwargs):
+        self.output_dir = output_dir
+        self.every = every
+        self.pattern = pattern
+        super().__init__(**kwargs)
+
+    def wants(self, frame_index, box):
+        return frame_index % self.every == 0
+
+    def _write(self, frame_index, frame, box):
+        cv2.imwrite(
+            os.path.join(self.output_dir, self.pattern.format(frame_index)),
+            self.annotate(to_bgr(frame), box),
+        )
+
+
+class CropSink(FrameSink):
+    # 只保存检测框周围 margin 像素的小图
+    def __init__(self, output_dir, margin=16, pattern="crop_{}.png", **kwargs):
+        self.output_dir = output_dir
+        self.margin = margin
+        self.pattern = pattern
+        super().__init__(**kwargs)
+
+    def wants(self, frame_index, box):
+        return box is not None
+
+    def _write(self, frame_index, frame, box):
+        x, y, w, h = box
+        crop = frame[
+            max(0, y - self.margin) : y + h + self.margin,
+            max(0, x - self.margin) : x + w + self.margin,
+        ]
+        cv2.imwrite(
+            os.path.join(self.output_dir, self.pattern.format(frame_index)), crop
+        )
+
+
+class VideoSink(FrameSink):
+    # 标注后的整段视频。帧必须按顺序写入, 所以只用一个线程。队列满时和其他
+    # 输出一样丢帧, 不让匹配等编码; 写入时发现帧序号不连续就重复上一帧补上,
+    # 视频的时长和时间轴仍与原视频一致。
+    def __init__(self, output_dir, fps, filename="annotated.mp4", **kwargs):
+        self.filename = os.path.join(output_dir, filename)
+        self.fps = fps
+        self.writer = None
+        self.last = None
+        kwargs["workers"] = 1
+        super().__init__(**kwargs)
+
+    def _write(self, frame_index, frame, box):
+        if self.writer is None:
+            height, width = frame.shape[:2]
+            self.writer = cv2.VideoWriter(
+                self.filename,
+                cv2.VideoWriter_fourcc(*"mp4v"),
+                self.fps,
+                (width, height),
+            )
+        elif self.last is not None:
+            last_index, last_frame = self.last
+            for _ in range(frame_index - last_index - 1):
+                self.writer.write(last_frame)
+        frame = self.annotate(to_bgr(frame), box)
+        self.writer.write(frame)
+        self.last = (frame_index, frame)
+
+    def _close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+
+def make_sink(mode, output_dir, fps=30, every=30, suffix="", pattern=None, **kwargs):
+    # suffix 用于并行处理时区分各段的输出文件
+    if mode == "none":
+        return NullSink()
+    os.makedirs(output_dir, exist_ok=True)
+    if mode == "sampled":
+        return SampledSink(output_dir, every, pattern or "frame_{}.png", **kwargs)
+    if mode == "crops":
+        return CropSink(output_dir, pattern=pattern or "crop_{}.png", **kwargs)
+    if mode == "video":
+        return VideoSink(output_dir, fps, f"annotated{suffix}.mp4", **kwargs)
+    raise ValueError(f"Unknown output mode: {mode}")
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from actionlog import (
+    NS_PER_SECOND,
+    ActionLogWriter,
+    SegmentedLogWriter,
+    iter_log,
+    load_log,
+)
+
+
+def test_events_before_anchor_are_rebased(tmp_path):
+    filename = str(tmp_path / "log.jsonl")
+    writer = ActionLogWriter(filename, None, flush_interval=0.05)
+    # 视频开始前的事件先压住, 知道锚点后再换算
+    writer.append({"time": 3 * NS_PER_SECOND, "type": "mouse_move"})
+    writer.append(
+        {
+            "start_time": 4 * NS_PER_SECOND,
+            "end_time": 5 * NS_PER_SECOND,
+            "type": "drag",
+            "start": {"x": 0.1, "y": 0.1, "start_time": 4 * NS_PER_SECOND},
+            "end": {"x": 0.2, "y": 0.2, "end_time": 5 * NS_PER_SECOND},
+        }
+    )
+    writer.set_anchor(2 * NS_PER_SECOND)
+    writer.append({"time": 6 * NS_PER_SECOND, "type": "click"})
+    writer.close()
+
+    events = load_log(filename)
+    assert [e["type"] for e in events] == ["mouse_move", "drag", "click"]
+    assert events[0]["time"] == 1.0
+    assert (events[1]["start_time"], events[1]["end_time"]) == (2.0, 3.0)
+    assert events[1]["start"]["start_time"] == 2.0
+    assert events[1]["end"]["end_time"] == 3.0
+    assert events[2]["time"] == 4.0
+    assert writer.count == 3
+
+
+def test_unanchored_events_written_on_close(tmp_path):
+    filename = str(tmp_path / "log.jsonl")
+    writer = ActionLogWriter(filename, 0)
+    writer.append({"time": NS_PER_SECOND, "type": "mouse_move"})
+    writer.close()
+    assert load_log(filename) == [{"time": 1.0, "type": "mouse_move"}]
+
+
+def test_iter_log_stops_at_truncated_line(tmp_path):
+    filename = tmp_path / "log.jsonl"
+    lines = [json.dumps({"time": t, "type": "mouse_move"}) for t in (0.1, 0.2)]
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n\n" + '{"time": 0.3, "ty')
+    assert [e["time"] for e in iter_log(str(filename))] == [0.1, 0.2]
+
+
+def test_segments_predicted_before_segment_list(tmp_path):
+    # 还不知道实际边界时按 segment_time 预测
+    pattern = str(tmp_path / "log_%03d.jsonl")
+    writer = SegmentedLogWriter(pattern, 0, 10)
+    writer.set_anchor(0)
+    writer.append({"time": 1 * NS_PER_SECOND, "type": "mouse_move"})
+    writer.append({"time": 25 * NS_PER_SECOND, "type": "mouse_move"})
+    writer.close()
+    assert load_log(pattern % 0)[0]["time"] == 1.0
+    assert not os.path.exists(pattern % 1)
+    assert load_log(pattern % 2)[0]["time"] == 5.0
+
+
+def test_segments_routed_and_rebased(tmp_path):
+    pattern = str(tmp_path / "log_%03d.jsonl")
+    writer = SegmentedLogWriter(pattern, 0, 10)
+    writer.set_anchor(0)
+    writer.append({"time": 1 * NS_PER_SECOND, "type": "mouse_move"})
+    # ffmpeg 报告第一个分段实际在 10.2 秒结束, 之后的边界从这里往后预测
+    writer.add_segment(0.0, 10.2)
+    writer.append({"time": int(10.5 * NS_PER_SECOND), "type": "mouse_move"})
+    # 分段结束 (文件已关闭) 之后才到的事件仍然写进它所在的分段
+    writer.append({"time": int(10.1 * NS_PER_SECOND), "type": "click"})
+    writer.append({"time": int(20.7 * NS_PER_SECOND), "type": "mouse_move"})
+    writer.add_segment(10.2, 20.2)
+    writer.append({"time": int(20.1 * NS_PER_SECOND), "type": "click"})
+    writer.close()
+
+    segments = [load_log(pattern % i) for i in range(3)]
+    assert [[e["type"] for e in s] for s in segments] == [
+        ["mouse_move", "click"],
+        ["mouse_move", "click"],
+        ["mouse_move"],
+    ]
+    assert [e["time"] for e in segments[0]] == [1.0, 10.1]
+    assert segments[1][0]["time"] == pytest.approx(0.3)
+    assert segments[1][1]["time"] == pytest.approx(9.9)
+    assert segments[2][0]["time"] == pytest.approx(0.5)
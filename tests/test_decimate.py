@@ -0,0 +1,57 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decimate import create_decimator
+
+# v2i.interpolate_mouse_position 在相邻日志点之间按时间线性插值, 与逐轴
+# np.interp 相同 (导入 v2i 会直接开始处理视频, 所以这里不导入它)
+
+
+def trace(seed, n=2000):
+    # 随机的鼠标轨迹: 停顿、匀速、急转和不均匀的事件间隔
+    rng = np.random.default_rng(seed)
+    t = np.cumsum(rng.uniform(0.001, 0.02, n))
+    velocity = np.zeros(2)
+    points = [np.zeros(2)]
+    for i in range(1, n):
+        if rng.random() < 0.05:
+            velocity = rng.normal(0, 400, 2) * (rng.random() < 0.8)
+        points.append(points[-1] + velocity * (t[i] - t[i - 1]))
+    xy = np.round(np.array(points))
+    return t, xy
+
+
+def replay(decimator, t, xy):
+    kept = []
+    for ti, (x, y) in zip(t, xy):
+        point = decimator.push(ti, x, y)
+        if point is not None:
+            kept.append(point)
+    point = decimator.flush()
+    if point is not None:
+        kept.append(point)
+    return np.array(kept)
+
+
+@pytest.mark.parametrize("mode", ["distance", "rdp"])
+@pytest.mark.parametrize("tolerance", [1, 2, 3, 5])
+@pytest.mark.parametrize("seed", range(5))
+def test_interpolated_error_within_tolerance(mode, tolerance, seed):
+    t, xy = trace(seed)
+    kept = replay(create_decimator(mode, tolerance), t, xy)
+    assert len(kept) < len(t)
+    x = np.interp(t, kept[:, 0], kept[:, 1])
+    y = np.interp(t, kept[:, 0], kept[:, 2])
+    error = np.hypot(x - xy[:, 0], y - xy[:, 1])
+    assert error.max() <= tolerance + 1e-9
+
+
+def test_endpoints_kept():
+    t, xy = trace(0, 200)
+    kept = replay(create_decimator("rdp", 2), t, xy)
+    assert tuple(kept[0]) == (t[0], *xy[0])
+    assert tuple(kept[-1]) == (t[-1], *xy[-1])
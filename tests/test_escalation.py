@@ -0,0 +1,50 @@
+import os
+import sys
+import cv2
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_find import synthetic_frames
+from find import Escalation, calculate_overlap, load_templates, process_video
+
+POSITIVE = os.path.join(ROOT, "cursors", "positive")
+NEGATIVE = os.path.join(ROOT, "cursors", "negative")
+
+
+def test_no_backoff_before_first_hit():
+    escalation = Escalation()
+    stats = {}
+    for _ in range(20):
+        escalation.miss(stats)
+    assert not any(escalation.backing_off(i) for i in range(20))
+    escalation.hit(object(), "global", stats)
+    for _ in range(escalation.max_misses):
+        escalation.miss(stats)
+    assert escalation.backing_off(1)
+    assert not escalation.backing_off(escalation.rescan_interval)
+
+
+def test_default_finds_visible_cursor_among_distractors(tmp_path):
+    # 光标一直可见, 背景上贴着负模板作为干扰物; 无损编码, 与合成画面逐像素相同
+    templates, negative_templates = load_templates(POSITIVE, NEGATIVE)
+    video = str(tmp_path / "distractors.avi")
+    writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"FFV1"), 30, (1280, 720))
+    truth = []
+    for frame, box in synthetic_frames(
+        templates, 200, 1280, 720, 0, distractors=negative_templates
+    ):
+        writer.write(frame)
+        truth.append(box)
+    writer.release()
+
+    output_dir = str(tmp_path / "out")
+    process_video(
+        video, POSITIVE, NEGATIVE, output_dir, 0.68, 0.75, 0.6, 200, output="none"
+    )
+    results = pd.read_csv(os.path.join(output_dir, "mouse_positions.csv"))
+    assert len(results) == len(truth)
+    for row in results.itertuples():
+        box = (row.X, row.Y, row.Width, row.Height)
+        assert calculate_overlap(box, truth[row.Frame]) >= 0.5
@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check import mark_video
+from actionlog import NS_PER_SECOND
+from framemap import FrameMap
+
+
+def frame_map(tmp_path, count=10, interval=0.1):
+    # 每输出一帧一条进度: 到 (n + 1) * interval 秒时已输出 n + 1 帧
+    filename = tmp_path / "frames.json"
+    with open(filename, "w") as f:
+        json.dump(
+            {
+                "frame": list(range(1, count + 1)),
+                "time": [(n + 1) * interval for n in range(count)],
+                "dup": [0] * count,
+                "drop": [0] * count,
+            },
+            f,
+        )
+    return FrameMap.load(filename)
+
+
+def test_index_at_exact_frame_time(tmp_path):
+    frames = frame_map(tmp_path)
+    # 0.3 秒时输出了 3 帧, 画面上是第 2 帧
+    assert frames.frame_at(0.3) == 3
+    assert frames.index_at(0.3) == 2
+    assert frames.index_at(0.0) == 0
+    assert frames.time_of_index(2) == pytest.approx(0.3)
+    assert frames.index_at(frames.time_of_index(5)) == 5
+
+
+def test_mark_video_uses_frame_index(tmp_path):
+    frames = frame_map(tmp_path)
+    video = str(tmp_path / "video.mp4")
+    writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 64))
+    for _ in range(10):
+        writer.write(np.zeros((64, 64, 3), np.uint8))
+    writer.release()
+    log = tmp_path / "log.json"
+    with open(log, "w") as f:
+        json.dump(
+            [
+                {
+                    "time": 0.3,
+                    "type": "click",
+                    "button": "Button.left",
+                    "position": {"x": 0.5, "y": 0.5},
+                }
+            ],
+            f,
+        )
+    output = str(tmp_path / "marked.mp4")
+    mark_video(str(log), video, output, 0, frames)
+
+    cap = cv2.VideoCapture(output)
+    marked = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        marked.append(frame.mean() > 10)
+    cap.release()
+    assert marked.index(True) == 2
+
+
+def test_segment_rebased_to_segment_start(tmp_path):
+    # 30 fps, 每 0.5 秒一条进度, 两个 10 秒的分段
+    anchor = 5 * NS_PER_SECOND
+    frames = FrameMap()
+    for n in range(1, 41):
+        frames.add(15 * n, anchor + n * NS_PER_SECOND // 2, 0, 0)
+    filename = tmp_path / "frames_001.json"
+    start = anchor + 10 * NS_PER_SECOND
+    frames.segment(start, start + 10 * NS_PER_SECOND, 300).save(filename, start)
+    part = FrameMap.load(filename)
+    # 分段内 0.5 秒时整段视频已输出 315 帧, 分段内是第 14 帧
+    assert part.index_at(0.5) == 14
+    assert part.index_at(0.0) == 0
+    assert part.time_of_index(14) == pytest.approx(0.5)
+    assert part.index_at(9.5) == 284
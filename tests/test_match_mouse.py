@@ -0,0 +1,153 @@
+import os
+import sys
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_find import synthetic_frames
+from find import calculate_overlap, load_templates, match_mouse
+
+TEMPLATES, NEGATIVE_TEMPLATES = load_templates(
+    os.path.join(ROOT, "cursors", "positive"), os.path.join(ROOT, "cursors", "negative")
+)
+
+
+def baseline_match_mouse(
+    frame,
+    templates,
+    negative_templates,
+    last_loc,
+    search_window_size,
+    threshold_min,
+    threshold_max,
+    overlap_threshold,
+    r=0,
+):
+    # 最初版本的 match_mouse, 原样保留作为对照: 逐个模板、逐个候选点与整个
+    # 搜索区域上的负模板匹配比较, ROI 里没找到时递归搜一次全图
+    frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    candidates = []
+
+    if last_loc:
+        x_center, y_center = last_loc
+        x_start = max(0, x_center - search_window_size // 2)
+        y_start = max(0, y_center - search_window_size // 2)
+        x_end = min(frame.shape[1], x_center + search_window_size // 2)
+        y_end = min(frame.shape[0], y_center + search_window_size // 2)
+        search_area = frame_gray[y_start:y_end, x_start:x_end]
+        search_offset = (x_start, y_start)
+    else:
+        search_area = frame_gray
+        search_offset = (0, 0)
+
+    for template, template_name in templates:
+        res = cv2.matchTemplate(search_area, template, cv2.TM_CCOEFF_NORMED)
+        loc = np.where(res >= threshold_min)
+
+        for pt in zip(*loc[::-1]):
+            full_img_pt = (pt[0] + search_offset[0], pt[1] + search_offset[1])
+            candidates.append(
+                (full_img_pt, template.shape[:2], template_name, res[pt[1]][pt[0]])
+            )
+
+    for candidate in candidates:
+        if candidate[3] >= threshold_max:
+            return candidate
+
+    negative_matches = []
+    for negative_template in negative_templates:
+        negative_res = cv2.matchTemplate(
+            search_area, negative_template, cv2.TM_CCOEFF_NORMED
+        )
+        negative_loc = np.where(negative_res >= threshold_min)
+        for neg_pt in zip(*negative_loc[::-1]):
+            full_img_neg_pt = (
+                neg_pt[0] + search_offset[0],
+                neg_pt[1] + search_offset[1],
+            )
+            negative_matches.append((full_img_neg_pt, negative_template.shape[:2]))
+
+    filtered_candidates = []
+    for candidate in candidates:
+        pt, size, template_name, val = candidate
+        max_overlap = 0
+        for neg_pt, neg_size in negative_matches:
+            rect1 = (pt[0], pt[1], size[1], size[0])
+            rect2 = (neg_pt[0], neg_pt[1], neg_size[1], neg_size[0])
+            overlap = calculate_overlap(rect1, rect2)
+            max_overlap = max(max_overlap, overlap)
+
+        if max_overlap < overlap_threshold:
+            filtered_candidates.append(candidate)
+
+    if filtered_candidates:
+        best_match = max(filtered_candidates, key=lambda x: x[3])
+        return best_match
+
+    if r == 1:
+        return None
+
+    return baseline_match_mouse(
+        frame,
+        templates,
+        negative_templates,
+        None,
+        None,
+        threshold_min,
+        threshold_max,
+        overlap_threshold,
+        1,
+    )
+
+
+def cases(seed, count=4, width=640, height=360):
+    # 合成帧上贴有负模板作为干扰物, 另外把一个负模板贴在光标旁边, 让负模板
+    # 过滤真正起作用; ROI 中心包括光标附近、画面四角和四边以及没有上一次位置
+    rng = np.random.default_rng(seed)
+    for frame, (x, y, w, h) in synthetic_frames(
+        TEMPLATES, count, width, height, seed, distractors=NEGATIVE_TEMPLATES
+    ):
+        negative = NEGATIVE_TEMPLATES[int(rng.integers(len(NEGATIVE_TEMPLATES)))]
+        nh, nw = negative.shape
+        nx = int(np.clip(x + rng.integers(-nw, w), 0, width - nw))
+        ny = int(np.clip(y + rng.integers(-nh, h), 0, height - nh))
+        frame[ny : ny + nh, nx : nx + nw] = cv2.cvtColor(negative, cv2.COLOR_GRAY2BGR)
+        for last_loc in (
+            (x + w // 2, y + h // 2),
+            (0, 0),
+            (width - 1, height - 1),
+            (width // 2, 0),
+            (0, height // 2),
+            (int(rng.integers(width)), int(rng.integers(height))),
+            None,
+        ):
+            yield frame, last_loc
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("thresholds", [(0.68, 0.75), (0.5, 0.99)])
+def test_exhaustive_matches_baseline(seed, thresholds):
+    for frame, last_loc in cases(seed):
+        args = (
+            frame,
+            TEMPLATES,
+            NEGATIVE_TEMPLATES,
+            last_loc,
+            120,
+            thresholds[0],
+            thresholds[1],
+            0.6,
+        )
+        expected = baseline_match_mouse(*args)
+        match = match_mouse(*args, matcher="exhaustive")
+        if expected is None:
+            assert match is None
+            continue
+        assert match is not None
+        assert tuple(map(int, match[0])) == tuple(map(int, expected[0]))
+        assert tuple(match[1]) == tuple(expected[1])
+        assert match[2] == expected[2]
+        assert float(match[3]) == pytest.approx(float(expected[3]), abs=1e-6)
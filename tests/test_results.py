@@ -0,0 +1,72 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results import DICTIONARY, ResultWriter
+
+COLUMNS = [
+    ("Frame", np.int64),
+    ("X", np.int32),
+    ("Template", DICTIONARY),
+    ("Confidence", np.float32),
+    ("Carried", np.bool_),
+]
+
+
+def rows(count):
+    return [
+        {
+            "Frame": i,
+            "X": i * 10,
+            "Template": f"frame_{i % 3}.png",
+            "Confidence": 0.5 + i / 100,
+            "Carried": i % 2 == 1,
+        }
+        for i in range(count)
+    ]
+
+
+def test_csv_chunks_and_contents(tmp_path):
+    filename = str(tmp_path / "results.csv")
+    writer = ResultWriter(filename, COLUMNS, chunk_size=4)
+    writer.extend(rows(10))
+    # 两块已经写出, 最后两行还在内存里
+    assert len(pd.read_csv(filename)) == 8
+    assert writer.size == 2
+    writer.close()
+
+    data = pd.read_csv(filename)
+    assert len(writer) == 10
+    assert list(data.columns) == [name for name, _ in COLUMNS]
+    assert data["Frame"].tolist() == list(range(10))
+    assert data["X"].tolist() == [i * 10 for i in range(10)]
+    assert data["Template"].tolist() == [f"frame_{i % 3}.png" for i in range(10)]
+    assert data["Carried"].tolist() == [i % 2 == 1 for i in range(10)]
+    assert data["Confidence"].tolist() == pytest.approx(
+        [np.float32(0.5 + i / 100) for i in range(10)]
+    )
+    assert data["Frame"].dtype == np.int64
+    assert data["Carried"].dtype == bool
+
+
+def test_buffers_typed_and_dictionary_encoded(tmp_path):
+    writer = ResultWriter(str(tmp_path / "results.csv"), COLUMNS, chunk_size=100)
+    writer.extend(rows(6))
+    assert writer.buffers["X"].dtype == np.int32
+    assert writer.buffers["Confidence"].dtype == np.float32
+    assert writer.buffers["Template"].dtype == np.int32
+    assert writer.buffers["Template"][:6].tolist() == [0, 1, 2, 0, 1, 2]
+    writer.close()
+
+
+def test_empty_writer_leaves_header(tmp_path):
+    filename = str(tmp_path / "results.csv")
+    with ResultWriter(filename, COLUMNS):
+        pass
+    data = pd.read_csv(filename)
+    assert list(data.columns) == [name for name, _ in COLUMNS]
+    assert len(data) == 0
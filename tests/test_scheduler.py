@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import Scheduler
+
+
+def test_reschedule_keeps_one_pending_callback():
+    scheduler = Scheduler()
+    calls = []
+    done = threading.Event()
+
+    def callback(i):
+        calls.append(i)
+        done.set()
+
+    scheduler.start()
+    # 每次滚动都把同一个 key 的截止时间往后推, 只有最后一次会执行
+    for i in range(200):
+        scheduler.schedule("scroll", 0.05, lambda i=i: callback(i))
+        assert scheduler.pending() == 1
+    assert len(scheduler.heap) <= 2 * scheduler.pending() + 65
+    assert done.wait(2)
+    time.sleep(0.1)
+    scheduler.stop()
+    assert calls == [199]
+    assert scheduler.pending() == 0
+
+
+def test_cancel():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.start()
+    scheduler.schedule("drag", 0.02, lambda: calls.append("drag"))
+    scheduler.cancel("drag")
+    time.sleep(0.1)
+    scheduler.stop()
+    assert calls == []
+
+
+def test_stop_runs_pending_in_deadline_order():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.start()
+    scheduler.schedule("keyboard", 60, lambda: calls.append("keyboard"))
+    scheduler.schedule("scroll", 30, lambda: calls.append("scroll old"))
+    scheduler.schedule("scroll", 90, lambda: calls.append("scroll"))
+    scheduler.stop(run_pending=True)
+    assert calls == ["keyboard", "scroll"]
+    assert scheduler.pending() == 0
+
+
+def test_stop_without_run_pending_drops_callbacks():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.start()
+    scheduler.schedule("keyboard", 60, lambda: calls.append("keyboard"))
+    scheduler.stop()
+    assert calls == []
@@ -0,0 +1,78 @@
+import os
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sinks import FrameSink, SampledSink, VideoSink
+
+
+class FailingSink(FrameSink):
+    def _write(self, frame_index, frame, box):
+        if frame_index % 2:
+            raise OSError("disk full")
+
+
+class SlowSink(FrameSink):
+    def __init__(self, **kwargs):
+        self.release = threading.Event()
+        super().__init__(**kwargs)
+
+    def _write(self, frame_index, frame, box):
+        self.release.wait()
+
+
+def close_in_thread(sink, timeout=10):
+    thread = threading.Thread(target=sink.close, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def test_write_errors_do_not_block_close():
+    sink = FailingSink(workers=2, max_queue=4)
+    frame = np.zeros((8, 8, 3), np.uint8)
+    for i in range(100):
+        sink.submit(i, frame)
+        time.sleep(0.001)
+    assert close_in_thread(sink)
+    assert sink.failed > 0
+    assert isinstance(sink.error, OSError)
+    assert sink.written + sink.failed + sink.dropped == 100
+
+
+def test_close_gives_up_after_timeout():
+    sink = SlowSink(workers=1, max_queue=2, timeout=0.2)
+    frame = np.zeros((8, 8, 3), np.uint8)
+    for i in range(10):
+        sink.submit(i, frame)
+    assert sink.dropped > 0
+    start = time.monotonic()
+    assert close_in_thread(sink)
+    assert time.monotonic() - start < 5
+    sink.release.set()
+
+
+def test_video_sink_fills_dropped_frames(tmp_path):
+    sink = VideoSink(str(tmp_path), 30)
+    for i in (0, 1, 4, 5):
+        sink.submit(i, np.full((64, 64, 3), i * 40, np.uint8))
+    sink.close()
+    cap = cv2.VideoCapture(str(tmp_path / "annotated.mp4"))
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 6
+    cap.release()
+
+
+def test_gray_frames_annotated_in_color(tmp_path):
+    sink = SampledSink(str(tmp_path), every=2)
+    gray = np.full((64, 64), 128, np.uint8)
+    for i in range(4):
+        sink.submit(i, gray, (10, 10, 20, 20))
+    sink.close()
+    assert sorted(os.listdir(tmp_path)) == ["frame_0.png", "frame_2.png"]
+    image = cv2.imread(str(tmp_path / "frame_0.png"))
+    assert tuple(image[10, 20]) == (0, 255, 0)
+    assert gray.ndim == 2 and (gray == 128).all()
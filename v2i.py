@@ -1,13 +1,9 @@
 import cv2
-import json
 import numpy as np
 import os
-import pandas as pd
-
-def load_json(json_path):
-    with open(json_path, "r") as file:
-        data = json.load(file)
-    return data
+from actionlog import load_log
+from results import ResultWriter
+from sinks import make_sink
 
 def interpolate_mouse_position(frame_time, timestamps, positions):
     if frame_time <= timestamps[0]:
@@ -59,21 +55,30 @@ def find_mouse(frame, x, y, radius=15, aspect_ratio_range=(0.8, 1.2)):
     else:
         return None
 
-def process_video(video_path, json_path, output_dir):
+def process_video(video_path, json_path, output_dir, output="sampled", sample_every=30):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     cap = cv2.VideoCapture(video_path)
-    mouse_data = load_json(json_path)
+    mouse_data = load_log(json_path)
     mouse_data = [item for item in mouse_data if item["type"] == "mouse_move"]
     timestamps = [item["time"] * 1000 for item in mouse_data]
     positions = [[item["position"]["x"], item["position"]["y"]] for item in mouse_data]
 
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    # 标注图片在后台线程写盘, output 可选 none / sampled / video / crops
+    sink = make_sink(output, output_dir, cap.get(cv2.CAP_PROP_FPS), sample_every)
 
     frame_count = 0
-    results = []
+    # 结果边处理边写出, 中途退出也能留下已处理部分
+    results = ResultWriter(os.path.join(output_dir, "mouse_positions.csv"), [
+        ("Frame", np.int64),
+        ("X", np.int32),
+        ("Y", np.int32),
+        ("Width", np.int32),
+        ("Height", np.int32),
+    ])
 
     while True:
         ret, frame = cap.read()
@@ -88,7 +93,6 @@ def process_video(video_path, json_path, output_dir):
         mouse = find_mouse(frame, x, y)
         if mouse:
             mx, my, mw, mh = mouse
-            cv2.rectangle(frame, (mx, my), (mx + mw, my + mh), (0, 255, 0), 2)
             results.append({
                 "Frame": frame_count,
                 "X": mx,
@@ -98,14 +102,12 @@ def process_video(video_path, json_path, output_dir):
             })
 
         print(f"Frame {frame_count}: {mouse}")
-        if mouse:
-            frame_file = f"frame_{frame_count}.png"
-            cv2.imwrite(os.path.join(output_dir, frame_file), frame)
+        sink.submit(frame_count, frame, mouse)
         frame_count += 1
 
     cap.release()
-    df = pd.DataFrame(results)
-    df.to_csv(os.path.join(output_dir, "mouse_positions.csv"), index=False)
+    sink.close()
+    results.close()
     print("Processing complete. Results saved to", output_dir)
 
 # Example usage
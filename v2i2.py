@@ -2,6 +2,7 @@ import cv2
 import csv
 import numpy as np
 import os
+from sinks import make_sink
 
 names = ["20240430_004041"]
 
@@ -34,8 +35,24 @@ def interpolate_mouse_position(frame_time, timestamps, positions):
     return positions[-1]
 
 
+def draw_point(frame, box):
+    # box 是以插值位置为中心的小方块, 在中心画一个红点
+    x, y, w, h = box
+    cv2.circle(frame, (x + w // 2, y + h // 2), 5, (0, 0, 255), -1)
+    return frame
+
+
 # 主函数
-def process_video(video_path, csv_path, output_folder, positions_output_path, name):
+def process_video(
+    video_path,
+    csv_path,
+    output_folder,
+    positions_output_path,
+    name,
+    output="sampled",
+    sample_every=30,
+    crop_size=32,
+):
     # 载入视频和CSV数据
     cap = cv2.VideoCapture(video_path)
     mouse_data = load_csv(csv_path)
@@ -47,9 +64,17 @@ def process_video(video_path, csv_path, output_folder, positions_output_path, na
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
 
-    # 准备输出文件夹
+    # 准备输出文件夹, 图片在后台线程写盘
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
+    sink = make_sink(
+        output,
+        output_folder,
+        fps,
+        sample_every,
+        pattern="{}.png",
+        annotate=draw_point,
+    )
 
     frame_index = -1
     mouse_positions = []
@@ -60,7 +85,8 @@ def process_video(video_path, csv_path, output_folder, positions_output_path, na
         while True:
             print(f"Processing frame {frame_index}")
             frame_index += 1
-            ret, frame = cap.read()
+            # 先只 grab, sink 要保存的帧才 retrieve (颜色转换和拷贝)
+            ret = cap.grab()
 
             if frame_index < 180:
                 continue
@@ -78,20 +104,19 @@ def process_video(video_path, csv_path, output_folder, positions_output_path, na
             mouse_positions.append(mouse_position)
 
             # 保存帧到文件夹
-            cv2.circle(
-                frame,
-                (int(mouse_position[0]), int(mouse_position[1])),
-                5,
-                (0, 0, 255),
-                -1,
-            )
-
-            cv2.imwrite(os.path.join(output_folder, f"{frame_index}.png"), frame)
+            x, y = int(mouse_position[0]), int(mouse_position[1])
+            half = crop_size // 2
+            box = (x - half, y - half, crop_size, crop_size)
+            if sink.wants(frame_index, box):
+                ret, frame = cap.retrieve()
+                if ret:
+                    sink.submit(frame_index, frame, box)
 
             # 写入鼠标位置到文件
             pos_file.write(f"{frame_index},{mouse_position[0]},{mouse_position[1]}\n")
 
     cap.release()
+    sink.close()
 
 
 for name in names: